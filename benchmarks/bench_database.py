@@ -0,0 +1,104 @@
+"""Mixed read/write throughput of the pooled WAL data layer vs. connect-per-call.
+
+Each worker thread runs a loop of summary lookups and upserts for a fixed
+duration against its own scratch database file, mimicking the request path
+(reads) racing the scheduler (writes).
+
+    python benchmarks/bench_database.py --threads 8 --write-ratio 0.2 --duration 5
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+def legacy_get(path, topic):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("SELECT summary, ui_summary, timestamp FROM summaries WHERE topic=?", (topic,))
+    result = c.fetchone()
+    conn.close()
+    return result
+
+def legacy_save(path, topic, summary, ui_summary, timestamp):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("INSERT OR REPLACE INTO summaries (topic, summary, ui_summary, timestamp) VALUES (?, ?, ?, ?)",
+              (topic, summary, ui_summary, timestamp))
+    conn.commit()
+    conn.close()
+
+def pooled_get(path, topic):
+    return database.load_summary_from_db(topic)
+
+def pooled_save(path, topic, summary, ui_summary, timestamp):
+    database.save_summary_to_db(topic, summary, ui_summary, timestamp)
+
+def run(get, save, path, threads, write_ratio, duration, topics):
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    body = "lorem ipsum " * 200
+
+    def worker():
+        local = {"reads": 0, "writes": 0, "errors": 0}
+        rng = random.Random()
+        while time.perf_counter() < deadline:
+            topic = f"topic-{rng.randrange(topics)}"
+            try:
+                if rng.random() < write_ratio:
+                    save(path, topic, body, "ui", time.time())
+                    local["writes"] += 1
+                else:
+                    get(path, topic)
+                    local["reads"] += 1
+            except sqlite3.OperationalError:
+                local["errors"] += 1
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    total = counts["reads"] + counts["writes"]
+    return {**counts, "ops_per_s": round(total / duration, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--topics", type=int, default=500)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("CREATE TABLE summaries (topic TEXT PRIMARY KEY, summary TEXT, ui_summary TEXT, timestamp REAL)")
+        conn.close()
+        results["connect_per_call"] = run(legacy_get, legacy_save, legacy_path, args.threads, args.write_ratio, args.duration, args.topics)
+
+        database.DATABASE_PATH = os.path.join(tmp, "pooled.db")
+        database.DB_POOL_SIZE = args.threads
+        database.close_db()
+        database.init_db()
+        results["pooled_wal"] = run(pooled_get, pooled_save, database.DATABASE_PATH, args.threads, args.write_ratio, args.duration, args.topics)
+        database.close_db()
+
+    results["speedup"] = round(results["pooled_wal"]["ops_per_s"] / max(results["connect_per_call"]["ops_per_s"], 1), 2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
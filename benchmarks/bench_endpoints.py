@@ -0,0 +1,167 @@
+"""End-to-end load test of the summarize endpoints against local fake upstreams.
+
+Starts the fakes from fake_upstreams.py, runs the app under uvicorn in a
+subprocess pointed at them (scratch database, rate limiting off), and drives
+each endpoint at fixed concurrency levels. Reports p50/p95/p99 latency,
+throughput, error counts and the server's peak RSS as JSON, so runs from two
+commits can be diffed:
+
+    python benchmarks/bench_endpoints.py --concurrency 1,8,32 --requests 200 --output before.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_upstreams import add_fake_arguments, fakes_from_arguments
+
+ENDPOINTS = ("summarize", "hackernews", "url", "text")
+
+def build_request(endpoint: str, n: int, topics: int, pages_url: str) -> tuple:
+    """Returns (method, path, kwargs) for the n-th request to an endpoint."""
+    if endpoint == "summarize":
+        return "GET", "/summarize", {"params": {"topic": f"bench-topic-{n % topics}"}}
+    if endpoint == "hackernews":
+        return "GET", "/summarize-hackernews", {}
+    if endpoint == "url":
+        return "POST", "/summarize-url", {"json": {"url": f"{pages_url}/article/{n % topics}"}}
+    if endpoint == "text":
+        return "POST", "/summarize-text", {"json": {"text": f"Benchmark document {n % topics}. " * 200}}
+    raise ValueError(endpoint)
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def peak_rss_kb(pid: int):
+    """The process's peak resident set size (VmHWM), or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+async def drive(base_url: str, endpoint: str, concurrency: int, requests: int, topics: int, pages_url: str, counter) -> dict:
+    latencies, statuses = [], {}
+    remaining = itertools.count()
+
+    async def worker(client: httpx.AsyncClient):
+        while next(remaining) < requests:
+            method, path, kwargs = build_request(endpoint, next(counter), topics, pages_url)
+            start = time.perf_counter()
+            try:
+                res = await client.request(method, path, **kwargs)
+                status = str(res.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "statuses": statuses,
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+    }
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_until_ready(base_url: str, server: subprocess.Popen, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"App server exited with code {server.returncode}")
+        try:
+            if httpx.get(f"{base_url}/openapi.json", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    sys.exit("App server did not start in time")
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"comma-separated subset of {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint and concurrency level")
+    parser.add_argument("--topics", type=int, default=1000, help="distinct topics/pages/texts; lower values raise the cache hit rate")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--server-log", help="write the app server's output to this file")
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+    endpoints = args.endpoints.split(",")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    with fakes_from_arguments(args) as fakes, tempfile.TemporaryDirectory() as tmp:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        env = {**os.environ, **fakes.app_env(), "DATABASE_PATH": os.path.join(tmp, "bench.db"), "RATE_LIMIT_ENABLED": "false"}
+        server_log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=server_log, stderr=subprocess.STDOUT,
+        )
+        try:
+            wait_until_ready(base_url, server)
+            report = {
+                "commit": git_commit(),
+                "config": {key: value for key, value in vars(args).items() if key not in ("output", "server_log")},
+                "startup_rss_kb": peak_rss_kb(server.pid),
+                "results": {},
+            }
+            counter = itertools.count()
+            for endpoint in endpoints:
+                report["results"][endpoint] = {}
+                for level in levels:
+                    result = asyncio.run(drive(base_url, endpoint, level, args.requests, args.topics, fakes.url("pages"), counter))
+                    result["peak_rss_kb"] = peak_rss_kb(server.pid)
+                    report["results"][endpoint][str(level)] = result
+                    print(f"{endpoint} c={level}: p50={result['p50_ms']}ms p99={result['p99_ms']}ms "
+                          f"{result['throughput_rps']} req/s errors={result['errors']}", file=sys.stderr)
+        finally:
+            server.terminate()
+            server.wait()
+            if args.server_log:
+                server_log.close()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
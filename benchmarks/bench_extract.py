@@ -0,0 +1,93 @@
+"""Extraction time and output size: url_fetcher.extract_text vs. BeautifulSoup(html.parser).get_text().
+
+Runs both extractors over a corpus of saved pages (every *.html file under
+--corpus). Without a corpus, synthetic article pages with navigation, scripts
+and footers are generated instead.
+
+    python benchmarks/bench_extract.py --corpus ~/saved-pages --repeat 3
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+import url_fetcher
+
+def synthetic_page(rng: random.Random) -> bytes:
+    words = "the of and a to in is you that it he was for on are as with his they at be this from".split()
+    def sentence():
+        return " ".join(rng.choices(words, k=rng.randint(8, 20))).capitalize() + "."
+    nav = "".join(f"<li><a href='/section/{i}'>Section {i}</a></li>" for i in range(60))
+    script = "<script>" + "window.dataLayer.push({event: 'view', id: %d});" % rng.randrange(10**6) * 200 + "</script>"
+    paragraphs = "".join(f"<p>{' '.join(sentence() for _ in range(5))}</p>" for _ in range(rng.randint(5, 30)))
+    comments = "".join(f"<div class='comment'>{sentence()}</div>" for _ in range(40))
+    return (
+        f"<html><head><title>Article {rng.randrange(1000)}</title><style>{'.x{color:red}' * 300}</style>{script}</head>"
+        f"<body><header><nav><ul>{nav}</ul></nav></header><main><article><h1>{sentence()}</h1>{paragraphs}</article>"
+        f"<aside>{comments}</aside></main><footer>{nav}</footer></body></html>"
+    ).encode()
+
+def load_corpus(path: str | None, pages: int, seed: int) -> list:
+    if path:
+        files = sorted(glob.glob(os.path.join(os.path.expanduser(path), "**", "*.html"), recursive=True))
+        corpus = []
+        for name in files:
+            with open(name, "rb") as f:
+                corpus.append(f.read())
+        return corpus
+    rng = random.Random(seed)
+    return [synthetic_page(rng) for _ in range(pages)]
+
+def legacy_extract(body: bytes) -> str:
+    return BeautifulSoup(body.decode("utf-8", errors="replace"), "html.parser").get_text()
+
+def fast_extract(body: bytes) -> str:
+    return url_fetcher.extract_text(body)[1]
+
+def measure(extract, corpus: list, repeat: int) -> dict:
+    samples, output_bytes = [], 0
+    for _ in range(repeat):
+        output_bytes = 0
+        for body in corpus:
+            start = time.perf_counter()
+            text = extract(body)
+            samples.append((time.perf_counter() - start) * 1000)
+            output_bytes += len(text.encode())
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.mean(samples), 3),
+        "total_ms": round(sum(samples) / repeat, 1),
+        "output_bytes": output_bytes,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="directory of saved .html pages")
+    parser.add_argument("--pages", type=int, default=200, help="synthetic pages to generate without --corpus")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, args.pages, args.seed)
+    if not corpus:
+        sys.exit("No pages found in the corpus.")
+    results = {
+        "pages": len(corpus),
+        "input_bytes": sum(len(body) for body in corpus),
+        "parser": "lxml" if url_fetcher.html_parser() is not None else "html.parser",
+        "bs4_html_parser": measure(legacy_extract, corpus, args.repeat),
+        "extract_text": measure(fast_extract, corpus, args.repeat),
+    }
+    results["speedup"] = round(results["bs4_html_parser"]["total_ms"] / max(results["extract_text"]["total_ms"], 0.001), 2)
+    results["output_reduction"] = round(1 - results["extract_text"]["output_bytes"] / max(results["bs4_html_parser"]["output_bytes"], 1), 3)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
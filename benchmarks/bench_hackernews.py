@@ -0,0 +1,107 @@
+"""Compares the old sequential Hacker News fetch with the concurrent async client.
+
+Runs against a local mock of the HN Firebase API with a fixed per-request
+latency, so the numbers only depend on round-trip counts and concurrency.
+
+    python benchmarks/bench_hackernews.py --latency 0.1 --limit 5 --text-every 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hackernews import HackerNewsClient
+
+def make_handler(latency: float, story_count: int, text_every: int):
+    class HackerNewsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path == "/v0/topstories.json":
+                body = list(range(1, story_count + 1))
+            elif self.path.startswith("/v0/item/"):
+                item_id = int(self.path.rsplit("/", 1)[1].split(".")[0])
+                body = {"id": item_id, "title": f"Story {item_id}", "url": f"http://example.com/{item_id}"}
+                if item_id % text_every == 0:
+                    body["text"] = f"Body of story {item_id}. " * 20
+            else:
+                self.send_error(404)
+                return
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return HackerNewsHandler
+
+def fetch_sequential(base_url: str, limit: int) -> list:
+    """The pre-async implementation: one blocking request per story, in order."""
+    res = requests.get(f"{base_url}/topstories.json")
+    res.raise_for_status()
+    posts = []
+    for story_id in res.json():
+        story = requests.get(f"{base_url}/item/{story_id}.json").json()
+        if story.get("text"):
+            posts.append({"title": story["title"], "text": story["text"], "url": story.get("url", "")})
+            if len(posts) == limit:
+                break
+    return posts
+
+async def fetch_concurrent(base_url: str, limit: int, concurrency: int) -> list:
+    client = HackerNewsClient(base_url=base_url, max_concurrency=concurrency)
+    try:
+        return await client.get_text_posts(limit)
+    finally:
+        await client.aclose()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.1, help="mock server latency per request, in seconds")
+    parser.add_argument("--limit", type=int, default=5, help="number of text posts to collect")
+    parser.add_argument("--stories", type=int, default=100, help="number of top stories served")
+    parser.add_argument("--text-every", type=int, default=3, help="every Nth story has a text body")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.latency, args.stories, args.text_every))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v0"
+
+    runs = {
+        "sequential": lambda: fetch_sequential(base_url, args.limit),
+        "concurrent": lambda: asyncio.run(fetch_concurrent(base_url, args.limit, args.concurrency)),
+    }
+    # One untimed pass of each, so one-time costs (lazy imports such as httpcore,
+    # the first connections) are not billed to whichever path runs first.
+    for run in runs.values():
+        run()
+
+    results = {}
+    for name, run in runs.items():
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            posts = run()
+            timings.append(time.perf_counter() - start)
+        results[name] = {"posts": len(posts), "best_s": round(min(timings), 4), "median_s": round(statistics.median(timings), 4)}
+    server.shutdown()
+
+    results["speedup"] = round(results["sequential"]["best_s"] / results["concurrent"]["best_s"], 2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
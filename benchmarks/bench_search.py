@@ -0,0 +1,106 @@
+"""Latency of FTS5 search vs. a LIKE scan over a synthetic corpus of stored posts.
+
+Fills a scratch database with generated posts, then times the same queries
+through `database.search_posts` and through an equivalent `LIKE '%term%'`
+table scan.
+
+    python benchmarks/bench_search.py --rows 100000 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+WORDS = (
+    "python rust golang asyncio database index latency cache query server client thread "
+    "memory network packet kernel compiler runtime garbage collector scheduler socket stream "
+    "summary reddit hacker news topic trending model token prompt vector search ranking"
+).split()
+
+def generate_posts(rows: int, rng: random.Random) -> list:
+    return [
+        {
+            "id": str(i),
+            "title": " ".join(rng.choices(WORDS, k=6)),
+            "text": " ".join(rng.choices(WORDS, k=80)) + f" filler{rng.randrange(rows)}",
+            "url": f"https://example.com/{i}",
+        }
+        for i in range(rows)
+    ]
+
+def like_search(term: str, limit: int) -> list:
+    with database.db_connection() as conn:
+        pattern = f"%{term}%"
+        return conn.execute(
+            "SELECT source, title, substr(text, 1, 64), url, last_seen FROM posts WHERE title LIKE ? OR text LIKE ? LIMIT ?",
+            (pattern, pattern, limit),
+        ).fetchall()
+
+def fts_search(term: str, limit: int) -> list:
+    return database.search_posts(term, limit)
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+def measure(search, queries: list, limit: int) -> dict:
+    samples = []
+    for term in queries:
+        start = time.perf_counter()
+        search(term, limit)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(percentile(samples, 0.95), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Rare terms only match a handful of rows, so a scan has to read the whole table.
+    # Common terms match most rows: the scan stops at the first `limit` hits, while
+    # FTS has to rank every match.
+    rare_queries = [f"filler{rng.randrange(args.rows)}" for _ in range(args.queries)]
+    common_queries = [rng.choice(WORDS) for _ in range(args.queries)]
+
+    results = {"rows": args.rows}
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_PATH = os.path.join(tmp, "search.db")
+        database.close_db()
+        database.init_db()
+
+        start = time.perf_counter()
+        posts = generate_posts(args.rows, rng)
+        for offset in range(0, len(posts), 5000):
+            database.save_posts("reddit", posts[offset:offset + 5000], time.time())
+        results["load_s"] = round(time.perf_counter() - start, 2)
+
+        for name, queries in (("rare_terms", rare_queries), ("common_terms", common_queries)):
+            like = measure(like_search, queries, args.limit)
+            fts = measure(fts_search, queries, args.limit)
+            results[name] = {
+                "like_scan": like,
+                "fts5_bm25": fts,
+                "p50_speedup": round(like["p50_ms"] / max(fts["p50_ms"], 0.001), 1),
+            }
+        database.close_db()
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
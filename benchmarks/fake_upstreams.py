@@ -0,0 +1,248 @@
+"""Local stand-ins for the Reddit, Hacker News and OpenAI APIs, plus a page server.
+
+Each fake runs its own ThreadingHTTPServer with configurable latency, payload
+size and error rate, so the app can be load tested without touching the live
+services. Start them on their own to point a dev server at them:
+
+    python benchmarks/fake_upstreams.py --latency 0.05 --error-rate 0.01
+
+which prints the environment variables that route the app to the fakes.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+WORDS = (
+    "python rust release performance latency database cache server async model token "
+    "community discussion question answer update bug feature benchmark memory thread"
+).split()
+
+@dataclass
+class FakeConfig:
+    latency: float = 0.05
+    error_rate: float = 0.0
+    payload_bytes: int = 1000
+
+def _text(seed: str, size: int) -> str:
+    """Deterministic pseudo-words of about `size` bytes, different for every seed."""
+    rng = random.Random(seed)
+    words, length = [], 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    config: FakeConfig
+
+    def _maybe_fail(self) -> bool:
+        time.sleep(self.config.latency)
+        if random.random() < self.config.error_rate:
+            self.send_error(500, "Injected failure")
+            return True
+        return False
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data):
+        self._send(200, json.dumps(data).encode())
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+class RedditHandler(_FakeHandler):
+    """Serves the token endpoint, topic search and trending subreddits."""
+
+    def do_POST(self):
+        if self._maybe_fail():
+            return
+        if self.path.startswith("/api/v1/access_token"):
+            self._send_json({"access_token": "bench-token", "token_type": "bearer", "expires_in": 3600})
+        else:
+            self.send_error(404)
+
+    def do_GET(self):
+        if self._maybe_fail():
+            return
+        url = urlparse(self.path)
+        if url.path == "/search":
+            query = parse_qs(url.query)
+            topic, limit = query.get("q", [""])[0], int(query.get("limit", ["5"])[0])
+            children = [
+                {"data": {
+                    "id": hashlib.sha1(f"{topic}-{i}".encode()).hexdigest()[:8],
+                    "title": f"{topic} post {i}",
+                    "selftext": _text(f"{topic}-{i}", self.config.payload_bytes),
+                    "url": f"https://reddit.example/{topic}/{i}",
+                    "is_reddit_media_domain": False,
+                    "is_video": False,
+                    "post_hint": "self",
+                }}
+                for i in range(limit)
+            ]
+            self._send_json({"data": {"children": children}})
+        elif url.path == "/api/trending_subreddits.json":
+            self._send_json({"subreddit_names": [f"bench{i}" for i in range(5)]})
+        else:
+            self.send_error(404)
+
+class HackerNewsHandler(_FakeHandler):
+    """Serves top stories that rotate on every call, so repeated runs see new items."""
+    counter = itertools.count()
+    story_count = 100
+
+    def do_GET(self):
+        if self._maybe_fail():
+            return
+        if self.path == "/v0/topstories.json":
+            start = next(self.counter) * 5
+            self._send_json(list(range(start + 1, start + self.story_count + 1)))
+        elif self.path.startswith("/v0/item/"):
+            item_id = int(self.path.rsplit("/", 1)[1].split(".")[0])
+            item = {"id": item_id, "title": f"Story {item_id}", "url": f"https://news.example/{item_id}"}
+            if item_id % 2 == 0:
+                item["text"] = _text(f"hn-{item_id}", self.config.payload_bytes)
+            self._send_json(item)
+        else:
+            self.send_error(404)
+
+class OpenAIHandler(_FakeHandler):
+    """Answers chat completions, in JSON mode when response_format asks for it."""
+
+    def do_POST(self):
+        if self._maybe_fail():
+            return
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        request = self._read_json()
+        prompt = request["messages"][-1]["content"]
+        summary = _text(prompt[-200:], self.config.payload_bytes // 2)
+        if request.get("response_format", {}).get("type") == "json_object":
+            content = json.dumps({"summary": summary, "ui_summary": summary[:80]})
+        else:
+            content = summary
+        self._send_json({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4, "total_tokens": (len(prompt) + len(content)) // 4},
+        })
+
+class PageHandler(_FakeHandler):
+    """Serves HTML article pages for /summarize-url, with an ETag per page."""
+
+    def do_GET(self):
+        if self._maybe_fail():
+            return
+        etag = f'"{hashlib.sha1(self.path.encode()).hexdigest()[:12]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", headers={"ETag": etag})
+            return
+        paragraphs = "".join(f"<p>{_text(f'{self.path}-{i}', self.config.payload_bytes // 5)}</p>" for i in range(5))
+        body = (
+            f"<html><head><title>Page {self.path}</title><script>var x = 1;</script></head>"
+            f"<body><nav>Home | About</nav><article>{paragraphs}</article><footer>Footer</footer></body></html>"
+        ).encode()
+        self._send(200, body, "text/html; charset=utf-8", {"ETag": etag})
+
+class _FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections under load, adding 1s SYN retries to the numbers.
+    request_queue_size = 256
+
+def _serve(handler_class, config: FakeConfig) -> ThreadingHTTPServer:
+    handler = type(handler_class.__name__, (handler_class,), {"config": config})
+    server = _FakeServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class FakeUpstreams:
+    """Starts all fakes on free local ports; use as a context manager."""
+
+    def __init__(self, reddit: FakeConfig, hackernews: FakeConfig, openai: FakeConfig, pages: FakeConfig):
+        self.configs = {"reddit": (RedditHandler, reddit), "hackernews": (HackerNewsHandler, hackernews),
+                        "openai": (OpenAIHandler, openai), "pages": (PageHandler, pages)}
+        self.servers = {}
+
+    def __enter__(self):
+        for name, (handler_class, config) in self.configs.items():
+            self.servers[name] = _serve(handler_class, config)
+        return self
+
+    def __exit__(self, *exc_info):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.servers[name].server_address[1]}"
+
+    def app_env(self) -> dict:
+        """Environment variables that route the app's upstream calls to the fakes, with the scheduler off."""
+        return {
+            "REDDIT_BASE_URL": self.url("reddit"),
+            "REDDIT_OAUTH_URL": self.url("reddit"),
+            "REDDIT_CLIENT_ID": "bench",
+            "REDDIT_CLIENT_SECRET": "bench",
+            "REDDIT_USER_AGENT": "bench",
+            "HN_API_BASE": f"{self.url('hackernews')}/v0",
+            "OPENAI_BASE_URL": f"{self.url('openai')}/v1",
+            "OPENAI_API_KEY": "bench",
+            # Background precompute would add its own upstream traffic to the measurements.
+            "SCHEDULER_ENABLED": "false",
+        }
+
+def add_fake_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.05, help="default upstream latency per request, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="default fraction of upstream requests that fail with a 500")
+    parser.add_argument("--payload-bytes", type=int, default=1000, help="default size of post bodies and completions")
+    for name in ("reddit", "hackernews", "openai", "pages"):
+        parser.add_argument(f"--{name}-latency", type=float, help=f"override --latency for the {name} fake")
+        parser.add_argument(f"--{name}-error-rate", type=float, help=f"override --error-rate for the {name} fake")
+        parser.add_argument(f"--{name}-payload-bytes", type=int, help=f"override --payload-bytes for the {name} fake")
+
+def fakes_from_arguments(args) -> FakeUpstreams:
+    def config(name):
+        def pick(option):
+            value = getattr(args, f"{name}_{option}")
+            return getattr(args, option) if value is None else value
+        return FakeConfig(latency=pick("latency"), error_rate=pick("error_rate"), payload_bytes=pick("payload_bytes"))
+    return FakeUpstreams(config("reddit"), config("hackernews"), config("openai"), config("pages"))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_fake_arguments(parser)
+    args = parser.parse_args()
+    with fakes_from_arguments(args) as fakes:
+        for name, value in fakes.app_env().items():
+            print(f"export {name}={value}")
+        print(f"# pages: {fakes.url('pages')}/<any path>")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""State shared between worker processes running the app on one host.
+
+- SQLiteStorage keeps slowapi/limits rate-limit counters in a SQLite file, so
+  a limit applies across all workers instead of per worker. Select it with
+  RATE_LIMIT_STORAGE_URI=sqlite:///path/to/limits.db (or sqlite:// for the
+  summaries database).
+- LeaderLease elects one process to run scheduled jobs: the lease is a row in
+  the summaries database that its holder keeps renewing, and that any other
+  process may take over once it expires.
+"""
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from urllib.parse import urlsplit
+from limits.storage import Storage
+from database import ConnectionPool, DATABASE_PATH, acquire_lease, release_lease
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds a scheduler lease lasts without renewal, i.e. how long a dead leader's jobs may go unrun.
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "60"))
+
+class SQLiteStorage(Storage):
+    """Fixed-window rate-limit counters in a SQLite table, for the limits library.
+
+    Each increment is a single UPSERT, so concurrent workers never lose counts.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+    # Expired rows are swept after this many increments.
+    SWEEP_EVERY = 1000
+
+    def __init__(self, uri: str | None = None, wrap_exceptions: bool = False, **options):
+        path = urlsplit(uri).path[1:] if uri else ""
+        self.pool = ConnectionPool(path or DATABASE_PATH, int(options.get("pool_size", 4)))
+        self._increments = 0
+        self._lock = threading.Lock()
+        with self.pool.connection() as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL)")
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        with self.pool.connection() as conn, conn:
+            count = conn.execute('''
+                INSERT INTO rate_limits (key, count, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    count = CASE WHEN rate_limits.expires_at <= ? THEN excluded.count ELSE rate_limits.count + excluded.count END,
+                    expires_at = CASE WHEN rate_limits.expires_at <= ? THEN excluded.expires_at ELSE rate_limits.expires_at END
+                RETURNING count
+            ''', (key, amount, now + expiry, now, now)).fetchone()[0]
+        with self._lock:
+            self._increments += 1
+            sweep = self._increments % self.SWEEP_EVERY == 0
+        if sweep:
+            with self.pool.connection() as conn, conn:
+                conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+        return count
+
+    def get(self, key: str) -> int:
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT expires_at FROM rate_limits WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self) -> bool:
+        try:
+            with self.pool.connection() as conn:
+                conn.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int | None:
+        with self.pool.connection() as conn, conn:
+            return conn.execute("DELETE FROM rate_limits").rowcount
+
+    def clear(self, key: str) -> None:
+        with self.pool.connection() as conn, conn:
+            conn.execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+class LeaderLease:
+    """A named lease that at most one process holds at a time."""
+
+    def __init__(self, name: str, ttl: float = LEADER_LEASE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+
+    def renew(self) -> bool:
+        """Takes or extends the lease, returning whether this process holds it."""
+        try:
+            leader = acquire_lease(self.name, self.holder, self.ttl, time.time())
+        except sqlite3.Error as e:
+            logger.error(f"Could not renew the {self.name} lease: {e}")
+            leader = False
+        if leader != self.is_leader:
+            logger.info(f"{'Acquired' if leader else 'Lost'} the {self.name} lease as {self.holder}")
+        self.is_leader = leader
+        return leader
+
+    def release(self):
+        if self.is_leader:
+            release_lease(self.name, self.holder)
+            self.is_leader = False
+
+    def run_if_leader(self, job):
+        """Wraps a scheduled job so it only runs in the process holding the lease."""
+        def run():
+            if self.renew():
+                job()
+            else:
+                logger.info(f"Skipping {job.__name__}: another process holds the {self.name} lease")
+        run.__name__ = job.__name__
+        return run
@@ -1,86 +1,596 @@
 import sqlite3
 import os
-from cryptography.fernet import Fernet
+import json
+import time
+import queue
+import asyncio
+import hashlib
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from memory_cache import LRUCache
+from metrics import span
 
-# Generate a key and instantiate a Fernet instance
 # In a real app, this key should be stored securely, e.g., as an environment variable
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
-if not ENCRYPTION_KEY:
-    ENCRYPTION_KEY = Fernet.generate_key().decode()
-    print(f"Generated new encryption key. Please set this in your environment variables: ENCRYPTION_KEY={ENCRYPTION_KEY}")
 
-cipher_suite = Fernet(ENCRYPTION_KEY.encode())
+@functools.lru_cache(maxsize=1)
+def cipher_suite():
+    """The Fernet instance for token encryption, created (and cryptography imported) on first use."""
+    from cryptography.fernet import Fernet
+    global ENCRYPTION_KEY
+    if not ENCRYPTION_KEY:
+        ENCRYPTION_KEY = Fernet.generate_key().decode()
+        print(f"Generated new encryption key. Please set this in your environment variables: ENCRYPTION_KEY={ENCRYPTION_KEY}")
+    return Fernet(ENCRYPTION_KEY.encode())
 
 def encrypt_token(token: str) -> str:
     """Encrypts a token."""
-    return cipher_suite.encrypt(token.encode()).decode()
+    return cipher_suite().encrypt(token.encode()).decode()
 
 def decrypt_token(encrypted_token: str) -> str:
     """Decrypts a token."""
-    return cipher_suite.decrypt(encrypted_token.encode()).decode()
+    return cipher_suite().decrypt(encrypted_token.encode()).decode()
+
+DATABASE_PATH = os.getenv("DATABASE_PATH", "summaries.db")
+
+# SQLite calls block, so async code runs them on this bounded pool instead of the event loop.
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "4"))
+db_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
+
+# One connection per executor thread plus headroom for the scheduler and other callers.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(DB_MAX_WORKERS + 2)))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "8192"))
+
+async def run_db(func, *args):
+    """Runs a blocking database function on the DB executor, timed as a db.<function> stage."""
+    # Executor threads do not inherit the caller's context; the copy carries the request's timings.
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(db_executor, context.run, _timed_db_call, func, *args)
+
+def _timed_db_call(func, *args):
+    with span(f"db.{func.__name__}"):
+        return func(*args)
+
+class ConnectionPool:
+    """A small pool of long-lived SQLite connections in WAL mode.
+
+    Connections are opened lazily up to `size`; callers beyond that wait for one
+    to be returned. Each connection keeps sqlite3's prepared statement cache, so
+    the fixed queries below are only compiled once per connection.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False, cached_statements=128)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode NORMAL only risks the last transactions on power loss, never corruption.
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._connections) < self.size:
+                conn = self._connect()
+                self._connections.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=DB_BUSY_TIMEOUT)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"connection pool exhausted: all {self.size} connections to {self.path} stayed busy for {DB_BUSY_TIMEOUT}s") from None
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+            self._idle = queue.LifoQueue()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DATABASE_PATH, DB_POOL_SIZE)
+    return _pool
+
+def db_connection():
+    """Borrows a pooled connection: `with db_connection() as conn: ...`."""
+    return get_pool().connection()
+
+def close_db():
+    """Closes every pooled connection; the pool reopens lazily on next use."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))
+# Age after which content- and document-keyed summaries are no longer served, and are pruned.
+SUMMARY_CONTENT_TTL = float(os.getenv("SUMMARY_CONTENT_TTL", "86400"))
+# Rows keyed by a hash rather than a topic; listings and search leave them out.
+TOPIC_ROWS = "topic NOT LIKE 'content-%' AND topic NOT LIKE 'document-%'"
+
+# In-process tier in front of the summaries table. Entries expire CACHE_TTL
+# seconds after the summary's timestamp; older rows are only served from SQLite.
+cache = LRUCache(
+    max_entries=int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "1024")),
+    max_bytes=int(os.getenv("SUMMARY_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+)
 
 def init_db():
-    conn = sqlite3.connect('summaries.db')
-    c = conn.cursor()
+    with db_connection() as conn, conn:
+        c = conn.cursor()
+        _add_summaries_id(c)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS summaries (
+                id INTEGER PRIMARY KEY,
+                topic TEXT NOT NULL UNIQUE,
+                summary TEXT,
+                ui_summary TEXT,
+                timestamp REAL
+            )
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_summaries_timestamp ON summaries (timestamp, topic)")
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE,
+                created_at REAL DEFAULT (strftime('%s', 'now'))
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS connected_accounts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                platform TEXT NOT NULL,
+                access_token TEXT NOT NULL,
+                refresh_token TEXT,
+                expires_at REAL,
+                scope TEXT,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS chunk_summaries (
+                content_hash TEXT PRIMARY KEY,
+                summary TEXT,
+                timestamp REAL
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS url_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                title TEXT,
+                text TEXT,
+                fetched_at REAL
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS summary_post_sets (
+                cache_key TEXT PRIMARY KEY,
+                post_hashes TEXT NOT NULL,
+                delta_count INTEGER NOT NULL DEFAULT 0,
+                timestamp REAL
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS summary_content_keys (
+                cache_key TEXT NOT NULL,
+                content_key TEXT NOT NULL,
+                PRIMARY KEY (cache_key, content_key)
+            )
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_summary_content_keys_content_key ON summary_content_keys (content_key)")
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS posts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT NOT NULL,
+                external_id TEXT NOT NULL,
+                title TEXT,
+                text TEXT,
+                url TEXT,
+                content_hash TEXT,
+                first_seen REAL,
+                last_seen REAL,
+                UNIQUE (source, external_id)
+            )
+        ''')
+        _ensure_column(c, "posts", "content_hash", "TEXT")
+        _ensure_column(c, "posts", "first_seen", "REAL")
+        _create_fts_index(c, "summaries_fts", "summaries", "id", ["summary", "ui_summary"])
+        _create_fts_index(c, "posts_fts", "posts", "id", ["title", "text"])
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS topic_requests (
+                topic TEXT NOT NULL,
+                requested_at REAL NOT NULL
+            )
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_topic_requests_requested_at ON topic_requests (requested_at)")
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS precompute_runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at REAL NOT NULL,
+                finished_at REAL
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS precompute_progress (
+                run_id INTEGER NOT NULL,
+                topic TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                error TEXT,
+                updated_at REAL,
+                PRIMARY KEY (run_id, topic),
+                FOREIGN KEY (run_id) REFERENCES precompute_runs (id)
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+    prune_derived_summaries(time.time())
+
+def _ensure_column(c, table: str, column: str, declaration: str):
+    """Adds a column that was introduced after `table` was first created."""
+    columns = {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+def _add_summaries_id(c):
+    """Gives summaries an INTEGER PRIMARY KEY for summaries_fts to use as its content rowid.
+
+    The implicit rowid of a table without one may change on VACUUM, which would
+    point the index at the wrong rows. SQLite cannot add a primary key to an
+    existing table, so the table is copied into a new one; the FTS table is
+    dropped too, and _create_fts_index rebuilds it.
+    """
+    columns = {row[1] for row in c.execute("PRAGMA table_info(summaries)")}
+    if not columns or "id" in columns:
+        return
+    c.execute("DROP TABLE IF EXISTS summaries_fts")
     c.execute('''
-        CREATE TABLE IF NOT EXISTS summaries (
-            topic TEXT PRIMARY KEY,
+        CREATE TABLE summaries_new (
+            id INTEGER PRIMARY KEY,
+            topic TEXT NOT NULL UNIQUE,
             summary TEXT,
             ui_summary TEXT,
             timestamp REAL
         )
     ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE,
-            created_at REAL DEFAULT (strftime('%s', 'now'))
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS connected_accounts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            platform TEXT NOT NULL,
-            access_token TEXT NOT NULL,
-            refresh_token TEXT,
-            expires_at REAL,
-            scope TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    c.execute("INSERT INTO summaries_new (topic, summary, ui_summary, timestamp) SELECT topic, summary, ui_summary, timestamp FROM summaries")
+    c.execute("DROP TABLE summaries")
+    c.execute("ALTER TABLE summaries_new RENAME TO summaries")
+
+def _create_fts_index(c, fts_table: str, table: str, rowid: str, columns: list):
+    """Creates an external-content FTS5 index over `table`, kept in sync by triggers."""
+    exists = c.execute("SELECT 1 FROM sqlite_master WHERE name=?", (fts_table,)).fetchone()
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    c.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5({column_list}, content='{table}', content_rowid='{rowid}')")
+    # Triggers are recreated on every start, so ones from an older schema never linger.
+    for trigger in ("insert", "delete", "update"):
+        c.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{trigger}")
+    c.execute(f"""
+        CREATE TRIGGER {table}_fts_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.{rowid}, {new_values});
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER {table}_fts_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.{rowid}, {old_values});
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER {table}_fts_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.{rowid}, {old_values});
+            INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.{rowid}, {new_values});
+        END
+    """)
+    if not exists:
+        # Index rows written before the FTS table existed.
+        c.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
 
 def get_summary_from_db(topic):
-    conn = sqlite3.connect('summaries.db')
-    c = conn.cursor()
-    c.execute("SELECT summary, ui_summary, timestamp FROM summaries WHERE topic=?", (topic,))
-    result = c.fetchone()
-    conn.close()
+    cached = cache.get(topic)
+    if cached is not None:
+        return cached
+    return load_summary_from_db(topic)
+
+def load_summary_from_db(topic):
+    """Reads a summary from SQLite, bypassing the in-memory tier but refilling it."""
+    with db_connection() as conn:
+        result = conn.execute("SELECT summary, ui_summary, timestamp FROM summaries WHERE topic=?", (topic,)).fetchone()
+    if result:
+        cache.set(topic, result, expires_at=result[2] + CACHE_TTL)
     return result
 
 def save_summary_to_db(topic, summary, ui_summary, timestamp):
-    conn = sqlite3.connect('summaries.db')
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO summaries (topic, summary, ui_summary, timestamp) VALUES (?, ?, ?, ?)",
-              (topic, summary, ui_summary, timestamp))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn, conn:
+        # An upsert rather than INSERT OR REPLACE: REPLACE deletes without firing
+        # the delete trigger, which would leave stale rows in summaries_fts.
+        conn.execute("""
+            INSERT INTO summaries (topic, summary, ui_summary, timestamp) VALUES (?, ?, ?, ?)
+            ON CONFLICT (topic) DO UPDATE SET summary=excluded.summary, ui_summary=excluded.ui_summary, timestamp=excluded.timestamp
+        """, (topic, summary, ui_summary, timestamp))
+    cache.set(topic, (summary, ui_summary, timestamp), expires_at=timestamp + CACHE_TTL)
+
+def list_summaries(limit: int, before: tuple | None = None, topic_prefix: str | None = None,
+                   newer_than: float | None = None, older_than: float | None = None) -> list:
+    """Lists summaries newest first, one page at a time.
+
+    `before` is the (timestamp, topic) of the last row of the previous page, so
+    each page is an index range scan instead of an OFFSET. Only the list columns
+    and a preview of the summary are read.
+    """
+    query = "SELECT topic, ui_summary, substr(summary, 1, 200), timestamp FROM summaries"
+    conditions, params = [TOPIC_ROWS], []
+    if before is not None:
+        conditions.append("(timestamp, topic) < (?, ?)")
+        params.extend(before)
+    if topic_prefix:
+        # A range instead of LIKE so the comparison is exact and case-sensitive.
+        conditions.append("topic >= ? AND topic < ?")
+        params.extend([topic_prefix, topic_prefix + "\U0010ffff"])
+    if newer_than is not None:
+        conditions.append("timestamp >= ?")
+        params.append(newer_than)
+    if older_than is not None:
+        conditions.append("timestamp < ?")
+        params.append(older_than)
+    query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY timestamp DESC, topic DESC LIMIT ?"
+    params.append(limit)
+    with db_connection() as conn:
+        return conn.execute(query, params).fetchall()
+
+def delete_summary_from_db(topic):
+    """Deletes a topic's summary along with every content-keyed copy of it."""
+    with db_connection() as conn, conn:
+        keys = [topic] + [row[0] for row in conn.execute("SELECT content_key FROM summary_content_keys WHERE cache_key=?", (topic,))]
+        conn.executemany("DELETE FROM summaries WHERE topic=?", [(key,) for key in keys])
+        conn.execute("DELETE FROM summary_post_sets WHERE cache_key=?", (topic,))
+        conn.execute("DELETE FROM summary_content_keys WHERE cache_key=?", (topic,))
+    for key in keys:
+        cache.delete(key)
+
+def prune_derived_summaries(now: float) -> int:
+    """Deletes content- and document-keyed summaries older than SUMMARY_CONTENT_TTL, returning how many."""
+    with db_connection() as conn, conn:
+        expired = [(row[0],) for row in conn.execute(
+            "SELECT topic FROM summaries WHERE timestamp < ? AND NOT (" + TOPIC_ROWS + ")", (now - SUMMARY_CONTENT_TTL,)
+        )]
+        conn.executemany("DELETE FROM summaries WHERE topic=?", expired)
+        conn.executemany("DELETE FROM summary_content_keys WHERE content_key=?", expired)
+        # Document keys stand in for topic keys, so they have post sets and content keys of their own.
+        conn.executemany("DELETE FROM summary_post_sets WHERE cache_key=?", expired)
+        conn.executemany("DELETE FROM summary_content_keys WHERE cache_key=?", expired)
+    for (key,) in expired:
+        cache.delete(key)
+    return len(expired)
+
+def get_summary_post_set(cache_key: str, timestamp: float):
+    """Returns (post hashes, delta count) for the posts a stored summary covers, or None.
+
+    `timestamp` is the stored summary's; a post set recorded for another version
+    of the summary is ignored.
+    """
+    with db_connection() as conn:
+        row = conn.execute("SELECT post_hashes, delta_count FROM summary_post_sets WHERE cache_key=? AND timestamp=?",
+                           (cache_key, timestamp)).fetchone()
+    if row is None:
+        return None
+    return set(json.loads(row[0])), row[1]
+
+def save_summary_post_set(cache_key: str, post_hashes, delta_count: int, timestamp: float, content_key: str | None = None):
+    """Records which posts a summary covers and how many incremental updates it has had since the last full one.
+
+    `content_key` is the content-keyed copy of the same summary; every one a
+    topic has had is deleted along with it.
+    """
+    with db_connection() as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO summary_post_sets (cache_key, post_hashes, delta_count, timestamp) VALUES (?, ?, ?, ?)",
+                     (cache_key, json.dumps(sorted(post_hashes)), delta_count, timestamp))
+        if content_key is not None:
+            conn.execute("INSERT OR IGNORE INTO summary_content_keys (cache_key, content_key) VALUES (?, ?)", (cache_key, content_key))
+
+def post_content_hash(post: dict) -> str:
+    return hashlib.sha256(f"{post['title']}\n{post['text']}".encode()).hexdigest()
+
+def _post_external_id(post: dict) -> str:
+    if post.get("id"):
+        return str(post["id"])
+    return post.get("url") or post_content_hash(post)
+
+def save_posts(source: str, posts: list, seen_at: float) -> list:
+    """Upserts fetched posts and returns each one's status: "new", "changed" or "unchanged".
+
+    Unchanged posts only have their last_seen time bumped, so they are not
+    re-indexed.
+    """
+    keys = [_post_external_id(post) for post in posts]
+    hashes = [post_content_hash(post) for post in posts]
+    with db_connection() as conn, conn:
+        placeholders = ", ".join("?" * len(keys))
+        known = dict(conn.execute(
+            f"SELECT external_id, content_hash FROM posts WHERE source=? AND external_id IN ({placeholders})",
+            (source, *keys),
+        ).fetchall())
+        statuses = []
+        for post, key, content_hash in zip(posts, keys, hashes):
+            if known.get(key) == content_hash:
+                statuses.append("unchanged")
+                conn.execute("UPDATE posts SET last_seen=? WHERE source=? AND external_id=?", (seen_at, source, key))
+                continue
+            statuses.append("changed" if key in known else "new")
+            known[key] = content_hash
+            conn.execute("""
+                INSERT INTO posts (source, external_id, title, text, url, content_hash, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (source, external_id) DO UPDATE SET
+                    title=excluded.title, text=excluded.text, url=excluded.url, content_hash=excluded.content_hash,
+                    first_seen=COALESCE(posts.first_seen, excluded.first_seen), last_seen=excluded.last_seen
+            """, (source, key, post["title"], post["text"], post.get("url", ""), content_hash, seen_at, seen_at))
+    return statuses
+
+def get_settled_posts(source: str, first_seen_before: float, last_seen_after: float) -> dict:
+    """Returns stored posts that were first seen before `first_seen_before` and are still being seen, keyed by upstream id."""
+    with db_connection() as conn:
+        rows = conn.execute(
+            "SELECT external_id, title, text, url FROM posts WHERE source=? AND first_seen < ? AND last_seen >= ?",
+            (source, first_seen_before, last_seen_after),
+        ).fetchall()
+    return {external_id: {"id": external_id, "title": title, "text": text, "url": url} for external_id, title, text, url in rows}
+
+def _fts_query(query: str) -> str:
+    """Turns free text into an FTS5 query that ANDs the words as quoted terms, so user input cannot inject syntax."""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+def search_summaries(query: str, limit: int, offset: int = 0) -> list:
+    """Ranks stored summaries by bm25 and returns (topic, snippet, ui_summary, timestamp) rows."""
+    with db_connection() as conn:
+        return conn.execute("""
+            SELECT s.topic, snippet(summaries_fts, -1, '[', ']', '...', 16), s.ui_summary, s.timestamp
+            FROM summaries_fts JOIN summaries s ON s.id = summaries_fts.rowid
+            WHERE summaries_fts MATCH ? AND s.topic NOT LIKE 'content-%' AND s.topic NOT LIKE 'document-%'
+            ORDER BY bm25(summaries_fts) LIMIT ? OFFSET ?
+        """, (_fts_query(query), limit, offset)).fetchall()
+
+def search_posts(query: str, limit: int, offset: int = 0) -> list:
+    """Ranks stored posts by bm25 and returns (source, title, snippet, url, last_seen) rows."""
+    with db_connection() as conn:
+        return conn.execute("""
+            SELECT p.source, p.title, snippet(posts_fts, 1, '[', ']', '...', 16), p.url, p.last_seen
+            FROM posts_fts JOIN posts p ON p.id = posts_fts.rowid
+            WHERE posts_fts MATCH ?
+            ORDER BY bm25(posts_fts, 2.0, 1.0) LIMIT ? OFFSET ?
+        """, (_fts_query(query), limit, offset)).fetchall()
+
+def get_chunk_summaries(content_hashes: list) -> dict:
+    """Returns cached chunk summaries for the given content hashes, keyed by hash."""
+    if not content_hashes:
+        return {}
+    placeholders = ",".join("?" * len(content_hashes))
+    with db_connection() as conn:
+        rows = conn.execute(f"SELECT content_hash, summary FROM chunk_summaries WHERE content_hash IN ({placeholders})", content_hashes).fetchall()
+    return dict(rows)
+
+def save_chunk_summary(content_hash: str, summary: str, timestamp: float):
+    with db_connection() as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO chunk_summaries (content_hash, summary, timestamp) VALUES (?, ?, ?)",
+                     (content_hash, summary, timestamp))
+
+def get_cached_url(url: str):
+    """Returns the cached extraction and validators for a URL, or None."""
+    with db_connection() as conn:
+        row = conn.execute("SELECT etag, last_modified, title, text FROM url_cache WHERE url=?", (url,)).fetchone()
+    if row is None:
+        return None
+    etag, last_modified, title, text = row
+    return {"etag": etag, "last_modified": last_modified, "title": title, "text": text}
+
+def save_cached_url(url: str, etag: str | None, last_modified: str | None, title: str, text: str, fetched_at: float):
+    with db_connection() as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO url_cache (url, etag, last_modified, title, text, fetched_at) VALUES (?, ?, ?, ?, ?, ?)",
+                     (url, etag, last_modified, title, text, fetched_at))
+
+def touch_cached_url(url: str, fetched_at: float):
+    with db_connection() as conn, conn:
+        conn.execute("UPDATE url_cache SET fetched_at=? WHERE url=?", (fetched_at, url))
+
+def record_topic_request(topic: str, requested_at: float):
+    with db_connection() as conn, conn:
+        conn.execute("INSERT INTO topic_requests (topic, requested_at) VALUES (?, ?)", (topic, requested_at))
+
+def get_topic_request_counts(since: float) -> dict:
+    """Returns how often each topic was requested since the given time."""
+    with db_connection() as conn:
+        rows = conn.execute("SELECT topic, COUNT(*) FROM topic_requests WHERE requested_at >= ? GROUP BY topic", (since,)).fetchall()
+    return dict(rows)
+
+def prune_topic_requests(before: float):
+    with db_connection() as conn, conn:
+        conn.execute("DELETE FROM topic_requests WHERE requested_at < ?", (before,))
+
+def create_precompute_run(topics: list, started_at: float) -> int:
+    """Creates a run whose topics are processed in list order."""
+    with db_connection() as conn, conn:
+        run_id = conn.execute("INSERT INTO precompute_runs (started_at) VALUES (?)", (started_at,)).lastrowid
+        conn.executemany("INSERT INTO precompute_progress (run_id, topic, priority, updated_at) VALUES (?, ?, ?, ?)",
+                         [(run_id, topic, priority, started_at) for priority, topic in enumerate(topics)])
+    return run_id
+
+def get_unfinished_precompute_run():
+    with db_connection() as conn:
+        row = conn.execute("SELECT id FROM precompute_runs WHERE finished_at IS NULL ORDER BY id DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+def get_pending_precompute_topics(run_id: int) -> list:
+    """Returns the run's topics that have not completed yet, in priority order."""
+    with db_connection() as conn:
+        rows = conn.execute("SELECT topic FROM precompute_progress WHERE run_id=? AND status != 'done' ORDER BY priority", (run_id,)).fetchall()
+    return [row[0] for row in rows]
+
+def update_precompute_progress(run_id: int, topic: str, status: str, error: str | None = None):
+    with db_connection() as conn, conn:
+        conn.execute("UPDATE precompute_progress SET status=?, error=?, updated_at=? WHERE run_id=? AND topic=?",
+                     (status, error, time.time(), run_id, topic))
+
+def finish_precompute_run(run_id: int, finished_at: float):
+    with db_connection() as conn, conn:
+        conn.execute("UPDATE precompute_runs SET finished_at=? WHERE id=?", (finished_at, run_id))
+
+def get_precompute_run_status(run_id: int) -> dict:
+    with db_connection() as conn:
+        rows = conn.execute("SELECT status, COUNT(*) FROM precompute_progress WHERE run_id=? GROUP BY status", (run_id,)).fetchall()
+    return dict(rows)
 
 def create_user(username: str) -> int:
     """Creates a new user and returns the user ID."""
-    conn = sqlite3.connect('summaries.db')
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO users (username) VALUES (?)", (username,))
-        user_id = c.lastrowid
-        conn.commit()
-    except sqlite3.IntegrityError:
-        c.execute("SELECT id FROM users WHERE username=?", (username,))
-        user_id = c.fetchone()[0]
-    finally:
-        conn.close()
+    with db_connection() as conn:
+        try:
+            with conn:
+                user_id = conn.execute("INSERT INTO users (username) VALUES (?)", (username,)).lastrowid
+        except sqlite3.IntegrityError:
+            user_id = conn.execute("SELECT id FROM users WHERE username=?", (username,)).fetchone()[0]
     return user_id
 
 def create_connected_account(user_id: int, platform: str, access_token: str, refresh_token: str, expires_at: float, scope: str):
@@ -88,23 +598,17 @@ def create_connected_account(user_id: int, platform: str, access_token: str, ref
     encrypted_access_token = encrypt_token(access_token)
     encrypted_refresh_token = encrypt_token(refresh_token) if refresh_token else None
 
-    conn = sqlite3.connect('summaries.db')
-    c = conn.cursor()
-    c.execute("""
-        INSERT OR REPLACE INTO connected_accounts
-        (user_id, platform, access_token, refresh_token, expires_at, scope)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (user_id, platform, encrypted_access_token, encrypted_refresh_token, expires_at, scope))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn, conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO connected_accounts
+            (user_id, platform, access_token, refresh_token, expires_at, scope)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (user_id, platform, encrypted_access_token, encrypted_refresh_token, expires_at, scope))
 
 def get_connected_account(user_id: int, platform: str):
     """Gets a connected account for a user."""
-    conn = sqlite3.connect('summaries.db')
-    c = conn.cursor()
-    c.execute("SELECT access_token, refresh_token, expires_at FROM connected_accounts WHERE user_id=? AND platform=?", (user_id, platform))
-    result = c.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        result = conn.execute("SELECT access_token, refresh_token, expires_at FROM connected_accounts WHERE user_id=? AND platform=?", (user_id, platform)).fetchone()
     if result:
         access_token, refresh_token, expires_at = result
         return {
@@ -113,3 +617,22 @@ def get_connected_account(user_id: int, platform: str):
             "expires_at": expires_at,
         }
     return None
+
+def acquire_lease(name: str, holder: str, ttl: float, now: float) -> bool:
+    """Takes or renews the named lease for `holder` until now + ttl.
+
+    Succeeds if the lease is free, expired or already held by `holder`, in one
+    statement, so competing processes cannot both win.
+    """
+    with db_connection() as conn, conn:
+        cursor = conn.execute('''
+            INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+            WHERE leases.holder = excluded.holder OR leases.expires_at <= ?
+        ''', (name, holder, now + ttl, now))
+        return cursor.rowcount == 1
+
+def release_lease(name: str, holder: str):
+    """Gives up the named lease if `holder` still has it."""
+    with db_connection() as conn, conn:
+        conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
@@ -0,0 +1,113 @@
+"""Shrinks a post list before it is put into a prompt.
+
+Three passes, in order:
+  - near-duplicate posts (reposts, crossposts, lightly edited copies) are
+    dropped, keeping the first, using bottom-k MinHash signatures of word shingles;
+  - lines repeated across posts (bot footers, "Edit: thanks for the award",
+    signatures) are kept only in the first post that has them;
+  - bodies longer than DEDUP_POST_MAX_TOKENS are cut at a word boundary.
+
+prepare_posts returns the reduced posts with a report of what was removed and
+how many prompt tokens that saved.
+"""
+import os
+import re
+import heapq
+import hashlib
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+# Estimated Jaccard similarity of word shingles at or above which a post is a duplicate.
+DEDUP_SIMILARITY = float(os.getenv("DEDUP_SIMILARITY", "0.7"))
+# Tokens kept of each post's text; 0 keeps whole posts.
+DEDUP_POST_MAX_TOKENS = int(os.getenv("DEDUP_POST_MAX_TOKENS", "500"))
+# Shorter repeated lines ("Thanks!", "This.") are ordinary replies, not boilerplate.
+BOILERPLATE_MIN_CHARS = 20
+SHINGLE_WORDS = 3
+SIGNATURE_SIZE = 64
+TRIM_MARKER = " [...]"
+
+_WORD_RE = re.compile(r"\w+")
+
+def _shingles(text: str) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+def minhash_signature(text: str, size: int = SIGNATURE_SIZE) -> frozenset:
+    """The `size` smallest 64-bit shingle hashes of the text (a bottom-k MinHash sketch)."""
+    hashes = (int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big") for shingle in _shingles(text))
+    return frozenset(heapq.nsmallest(size, hashes))
+
+def estimate_similarity(a: frozenset, b: frozenset, size: int = SIGNATURE_SIZE) -> float:
+    """Estimates the Jaccard similarity of the shingle sets behind two signatures.
+
+    Exact when both texts have fewer than `size` shingles.
+    """
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    union = heapq.nsmallest(size, a | b)
+    return sum(1 for h in union if h in a and h in b) / len(union)
+
+def drop_near_duplicates(posts: list, threshold: float = DEDUP_SIMILARITY) -> list:
+    """Returns the posts without those similar to an earlier one."""
+    kept, signatures = [], []
+    for post in posts:
+        signature = minhash_signature(f"{post['title']}\n{post['text']}")
+        if any(estimate_similarity(signature, other) >= threshold for other in signatures):
+            continue
+        kept.append(post)
+        signatures.append(signature)
+    return kept
+
+def collapse_boilerplate(posts: list) -> tuple:
+    """Removes lines already seen in an earlier post. Returns (posts, lines removed)."""
+    seen, removed, collapsed = set(), 0, []
+    for post in posts:
+        lines = []
+        for line in post["text"].split("\n"):
+            key = " ".join(line.lower().split())
+            if len(key) >= BOILERPLATE_MIN_CHARS:
+                if key in seen:
+                    removed += 1
+                    continue
+                seen.add(key)
+            lines.append(line)
+        collapsed.append({**post, "text": "\n".join(lines).strip()} if len(lines) < len(post["text"].split("\n")) else post)
+    return collapsed, removed
+
+def trim_text(text: str, max_tokens: int, count_tokens) -> str:
+    """Cuts text at a word boundary so it fits in max_tokens, marking the cut."""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    words = text.split(" ")
+    # Start from the proportional cut and shrink until the marker fits too.
+    keep = max(1, len(words) * max_tokens // tokens)
+    while keep > 1 and count_tokens(" ".join(words[:keep]) + TRIM_MARKER) > max_tokens:
+        keep = keep * 9 // 10
+    return " ".join(words[:keep]) + TRIM_MARKER
+
+def prepare_posts(posts: list, count_tokens, max_tokens: int | None = None, threshold: float | None = None) -> tuple:
+    """Returns (posts to put in the prompt, report).
+
+    The report counts the posts and lines removed and the prompt tokens of the
+    posts before and after.
+    """
+    max_tokens = DEDUP_POST_MAX_TOKENS if max_tokens is None else max_tokens
+    threshold = DEDUP_SIMILARITY if threshold is None else threshold
+    tokens_before = sum(count_tokens(f"{post['title']}\n{post['text']}") for post in posts)
+    report = {"posts": len(posts), "duplicates": 0, "boilerplate_lines": 0, "trimmed": 0,
+              "tokens_before": tokens_before, "tokens_after": tokens_before}
+    if not DEDUP_ENABLED:
+        return posts, report
+
+    kept = drop_near_duplicates(posts, threshold)
+    report["duplicates"] = len(posts) - len(kept)
+    kept, report["boilerplate_lines"] = collapse_boilerplate(kept)
+    if max_tokens > 0:
+        trimmed = [{**post, "text": trim_text(post["text"], max_tokens, count_tokens)} for post in kept]
+        report["trimmed"] = sum(1 for old, new in zip(kept, trimmed) if old["text"] != new["text"])
+        kept = trimmed
+    report["tokens_after"] = sum(count_tokens(f"{post['title']}\n{post['text']}") for post in kept)
+    return kept, report
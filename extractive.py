@@ -0,0 +1,123 @@
+"""Local extractive summarizer: TextRank over TF-IDF sentence vectors.
+
+Picks the most central sentences of the posts without any network call, so it
+answers in milliseconds. Used as a summary backend of its own and as the
+fallback when the LLM is too slow.
+"""
+import re
+import math
+import functools
+from collections import Counter
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_WORD_RE = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i if in into is it its me my not of on or our she so "
+    "that the their them there they this to was we were what when which who will with you your".split()
+)
+# Sentence count cap; TextRank is quadratic in the number of sentences.
+MAX_SENTENCES = 400
+WORD_BUDGETS = {"short": 50, "medium": 100, "long": 200}
+UI_SUMMARY_MAX_WORDS = 30
+# Sentences this similar to one already picked are skipped as repeats.
+REDUNDANCY_THRESHOLD = 0.8
+
+@functools.lru_cache(maxsize=1)
+def _numpy():
+    """NumPy if it is installed, else None. Imported on first use to keep it out of startup."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def split_sentences(posts: list) -> list:
+    """Returns the sentences of all posts (titles first), skipping fragments of fewer than four words."""
+    sentences, seen = [], set()
+    for post in posts:
+        title = " ".join(post["title"].split())
+        # Titles rarely end in punctuation, which would run them into the next sentence.
+        if title and title[-1] not in ".!?":
+            title += "."
+        for part in [title, *_SENTENCE_RE.split(post["text"])]:
+            sentence = " ".join(part.split())
+            if len(sentence.split()) >= 4 and sentence not in seen:
+                seen.add(sentence)
+                sentences.append(sentence)
+                if len(sentences) == MAX_SENTENCES:
+                    return sentences
+    return sentences
+
+def _tokens(sentence: str) -> list:
+    return [word for word in _WORD_RE.findall(sentence.lower()) if word not in STOPWORDS]
+
+def _sentence_vectors(sentences: list):
+    """L2-normalized TF-IDF rows, one per sentence."""
+    np = _numpy()
+    tokenized = [_tokens(sentence) for sentence in sentences]
+    document_frequency = Counter(word for tokens in tokenized for word in set(tokens))
+    vocabulary = {word: i for i, word in enumerate(document_frequency)}
+    vectors = np.zeros((len(sentences), len(vocabulary)), dtype=np.float32)
+    for row, tokens in enumerate(tokenized):
+        for word, count in Counter(tokens).items():
+            vectors[row, vocabulary[word]] = count * math.log((1 + len(sentences)) / (1 + document_frequency[word]))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def textrank(vectors, damping: float = 0.85, iterations: int = 50, tolerance: float = 1e-6):
+    """PageRank over the cosine-similarity graph of the sentence vectors."""
+    np = _numpy()
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, 0)
+    row_sums = similarity.sum(axis=1, keepdims=True)
+    transition = similarity / np.where(row_sums == 0, 1, row_sums)
+    count = len(vectors)
+    scores = np.full(count, 1 / count, dtype=np.float32)
+    for _ in range(iterations):
+        updated = (1 - damping) / count + damping * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < tolerance:
+            return updated
+        scores = updated
+    return scores
+
+def _rank(sentences: list) -> tuple:
+    """Returns (sentence indexes best first, vectors or None)."""
+    if _numpy() is None:
+        # Without NumPy fall back to lead sentences, which is what news-style summaries favour anyway.
+        return list(range(len(sentences))), None
+    vectors = _sentence_vectors(sentences)
+    scores = textrank(vectors)
+    return sorted(range(len(sentences)), key=lambda i: (-scores[i], i)), vectors
+
+def _truncate_words(text: str, max_words: int) -> str:
+    words = text.split()
+    return text if len(words) <= max_words else " ".join(words[:max_words]) + "..."
+
+def extractive_summary(posts: list, summary_format: str = "text", summary_length: str = "medium") -> tuple:
+    """Returns (summary, ui_summary) built from the most central sentences, in their original order."""
+    sentences = split_sentences(posts)
+    if not sentences:
+        text = " ".join(" ".join(post["text"].split()) for post in posts) or " ".join(post["title"] for post in posts)
+        return _truncate_words(text, WORD_BUDGETS.get(summary_length, 100)), _truncate_words(text, UI_SUMMARY_MAX_WORDS)
+
+    ranked, vectors = _rank(sentences)
+    budget = WORD_BUDGETS.get(summary_length, 100)
+    chosen, words = [], 0
+    for i in ranked:
+        length = len(sentences[i].split())
+        # The best sentence is always taken; after that, only ones that still fit the budget.
+        if chosen and words + length > budget:
+            continue
+        if vectors is not None and any(float(vectors[i] @ vectors[j]) > REDUNDANCY_THRESHOLD for j in chosen):
+            continue
+        chosen.append(i)
+        words += length
+    picked = [sentences[i] for i in sorted(chosen)]
+
+    if summary_format == "bullets":
+        summary = "\n".join(f"- {sentence}" for sentence in picked)
+    elif summary_format == "tldr":
+        summary = "TL;DR: " + " ".join(picked)
+    else:
+        summary = " ".join(picked)
+    return summary, _truncate_words(sentences[ranked[0]], UI_SUMMARY_MAX_WORDS)
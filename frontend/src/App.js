@@ -21,6 +21,7 @@ function App() {
   const [uiSummary, setUiSummary] = useState('');
   const [posts, setPosts] = useState([]);
   const [loading, setLoading] = useState(false);
+  const [streaming, setStreaming] = useState(false);
   const [words, setWords] = useState([]);
   const [darkMode, setDarkMode] = useState(false);
   const [history, setHistory] = useState([]);
@@ -74,7 +75,7 @@ function App() {
     }
   }, [summary]);
 
-  const handleSubmit = async (e) => {
+  const handleSubmit = (e) => {
     e.preventDefault();
     if (!topic || !topic.value.trim()) {
       setError('Please enter a valid topic.');
@@ -82,34 +83,62 @@ function App() {
     }
     setError('');
     setLoading(true);
+    setStreaming(true);
     setSummary('');
     setUiSummary('');
     setPosts([]);
     setWords([]);
     setTimestamp(null);
 
-    try {
-      const response = await fetch(`/summarize?topic=${topic.value.trim()}&summary_format=${summaryFormat}&sentiment_analysis=${sentimentAnalysis}&summary_length=${summaryLength}&prompt_template=${promptTemplate.value}`);
-      const data = await response.json();
-      if (response.ok && data.summary?.trim()) {
-        setSummary(data.summary);
-        setUiSummary(data.ui_summary);
-        setPosts(data.posts);
-        setTimestamp(data.timestamp);
-        if (topic.value.trim() && !history.includes(topic.value.trim())) {
-          const newHistory = [topic.value.trim(), ...history].slice(0, 5);
-          setHistory(newHistory);
-          localStorage.setItem('topicHistory', JSON.stringify(newHistory));
-        }
-      } else {
+    const query = new URLSearchParams({
+      topic: topic.value.trim(),
+      summary_format: summaryFormat,
+      sentiment_analysis: sentimentAnalysis,
+      summary_length: summaryLength,
+      prompt_template: promptTemplate.value,
+    });
+    const source = new EventSource(`/summarize/stream?${query}`);
+    let streamedSummary = '';
+
+    const finish = (data) => {
+      source.close();
+      setLoading(false);
+      setStreaming(false);
+      if (!data.summary?.trim()) {
         setError(`No summary found for topic "${topic.value.trim()}".`);
+        return;
       }
-    } catch (error) {
-      console.error('Error fetching summary:', error);
-      setError('Failed to generate summary.');
-    } finally {
+      setSummary(data.summary);
+      setUiSummary(data.ui_summary);
+      setTimestamp(data.timestamp || Date.now() / 1000);
+      if (topic.value.trim() && !history.includes(topic.value.trim())) {
+        const newHistory = [topic.value.trim(), ...history].slice(0, 5);
+        setHistory(newHistory);
+        localStorage.setItem('topicHistory', JSON.stringify(newHistory));
+      }
+    };
+
+    source.addEventListener('posts', (event) => {
+      setPosts(JSON.parse(event.data).posts);
       setLoading(false);
-    }
+    });
+    source.addEventListener('token', (event) => {
+      streamedSummary += JSON.parse(event.data).text;
+      setSummary(streamedSummary);
+    });
+    source.addEventListener('ui_summary', (event) => {
+      setUiSummary(JSON.parse(event.data).ui_summary);
+    });
+    source.addEventListener('cached', (event) => finish(JSON.parse(event.data)));
+    source.addEventListener('done', (event) => finish(JSON.parse(event.data)));
+    source.addEventListener('error', (event) => {
+      source.close();
+      setLoading(false);
+      setStreaming(false);
+      const detail = event.data ? JSON.parse(event.data).detail : null;
+      console.error('Error streaming summary:', detail);
+      setError(`No summary found for topic "${topic.value.trim()}".`);
+    });
   };
 
   const handleHackerNewsSummary = async () => {
@@ -190,6 +219,7 @@ function App() {
           setSummaryLength={setSummaryLength}
           handleSubmit={handleSubmit}
           loading={loading}
+          streaming={streaming}
         />
         <History history={history} setTopic={setTopic} />
         <Summary
@@ -24,6 +24,7 @@ function SummarizerForm({
   setSummaryLength,
   handleSubmit,
   loading,
+  streaming,
 }) {
   return (
     <form onSubmit={handleSubmit}>
@@ -131,9 +132,9 @@ function SummarizerForm({
       <button
         type="submit"
         className="w-full bg-blue-500 text-white py-2 rounded-lg hover:bg-blue-600"
-        disabled={loading || !topic}
+        disabled={loading || streaming || !topic}
       >
-        {loading ? 'Summarizing...' : 'Summarize Reddit'}
+        {loading ? 'Summarizing...' : streaming ? 'Streaming summary...' : 'Summarize Reddit'}
       </button>
     </form>
   );
@@ -1,25 +1,125 @@
-import requests
+import os
+import time
+import asyncio
+import httpx
 from fastapi import HTTPException
 import logging
+from database import run_db, save_posts, get_settled_posts
+from metrics import span
+from upstream import arequest, UpstreamUnavailable, DeadlineExceeded
 
 logger = logging.getLogger(__name__)
 
-async def get_hacker_news_posts(limit: int = 5):
-    """Fetches top stories from Hacker News."""
-    try:
-        res = requests.get("https://hacker-news.firebaseio.com/v0/topstories.json")
+HN_API_BASE = os.getenv("HN_API_BASE", "https://hacker-news.firebaseio.com/v0")
+HN_MAX_CONCURRENCY = int(os.getenv("HN_MAX_CONCURRENCY", "10"))
+HN_ITEM_TIMEOUT = float(os.getenv("HN_ITEM_TIMEOUT", "5"))
+# Upper bound on how many top stories are inspected while looking for text posts.
+HN_MAX_SCAN = int(os.getenv("HN_MAX_SCAN", "100"))
+# Stories can be edited for two hours after submission; stored posts older than
+# this are served from the post store instead of being fetched again.
+HN_EDIT_WINDOW = float(os.getenv("HN_EDIT_WINDOW", str(2 * 3600)))
+# Only stored posts seen on the front page within this window are considered.
+HN_KNOWN_POST_WINDOW = float(os.getenv("HN_KNOWN_POST_WINDOW", str(24 * 3600)))
+
+class HackerNewsClient:
+    """Async Hacker News client that fetches item documents concurrently."""
+
+    def __init__(self, base_url: str = HN_API_BASE, max_concurrency: int = HN_MAX_CONCURRENCY,
+                 item_timeout: float = HN_ITEM_TIMEOUT, max_scan: int = HN_MAX_SCAN, transport=None):
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.item_timeout = item_timeout
+        self.max_scan = max_scan
+        self.transport = transport
+        self._client = None
+        self._client_loop = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Pooled connections belong to the event loop that opened them, so a
+        # new loop (e.g. the scheduler's asyncio.run) gets its own client.
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+            self._client = httpx.AsyncClient(base_url=self.base_url, limits=limits,
+                                             timeout=self.item_timeout, transport=self.transport)
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_top_story_ids(self) -> list:
+        with span("hackernews.topstories"):
+            res = await arequest(self.client, "hackernews", "GET", "/topstories.json")
         res.raise_for_status()
-        top_stories_ids = res.json()
+        return res.json()
+
+    async def get_item(self, item_id: int, semaphore: asyncio.Semaphore):
+        """Fetches one item, returning None if it times out or fails.
+
+        Items are not retried: a missing story just lets the next one in the ranking through.
+        Their short timeouts do not count toward the breaker, and an open breaker
+        or a spent deadline skips the item like any other failure.
+        """
+        async with semaphore:
+            try:
+                with span("hackernews.item"):
+                    res = await arequest(self.client, "hackernews", "GET", f"/item/{item_id}.json", retries=0, timeout=self.item_timeout, count_timeouts=False)
+                res.raise_for_status()
+                return res.json()
+            except (asyncio.TimeoutError, httpx.HTTPError, UpstreamUnavailable, DeadlineExceeded) as e:
+                logger.warning(f"Skipping Hacker News item {item_id}: {e!r}")
+                return None
+
+    async def get_text_posts(self, limit: int = 5, known_posts: dict | None = None) -> list:
+        """Returns the first `limit` top stories that have a text body, in ranking order.
+
+        Stories found in `known_posts` (keyed by string id) are taken from there
+        instead of being fetched.
+        """
+        known_posts = known_posts or {}
+        story_ids = (await self.get_top_story_ids())[:self.max_scan]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def get_post(story_id):
+            if str(story_id) in known_posts:
+                return dict(known_posts[str(story_id)])
+            item = await self.get_item(story_id, semaphore)
+            if item and item.get("text"):
+                return {"id": item.get("id"), "title": item["title"], "text": item["text"], "url": item.get("url", "")}
+            return None
 
         posts = []
-        for story_id in top_stories_ids[:limit]:
-            story_res = requests.get(f"https://hacker-news.firebaseio.com/v0/item/{story_id}.json")
-            story_res.raise_for_status()
-            story_data = story_res.json()
-            if story_data.get("text"):
-                posts.append({"title": story_data["title"], "text": story_data["text"], "url": story_data.get("url", "")})
+        batch_size = max(limit, self.max_concurrency)
+        for start in range(0, len(story_ids), batch_size):
+            batch = story_ids[start:start + batch_size]
+            for post in await asyncio.gather(*(get_post(story_id) for story_id in batch)):
+                if post:
+                    posts.append(post)
+                    if len(posts) == limit:
+                        return posts
+        return posts
+
+hn_client = HackerNewsClient()
+
+async def get_hacker_news_posts(limit: int = 5):
+    """Fetches top stories from Hacker News, reusing stored posts that can no longer change.
+
+    Each post is tagged with its store status: "new", "changed" or "unchanged".
+    """
+    try:
+        now = time.time()
+        known_posts = await run_db(get_settled_posts, "hackernews", now - HN_EDIT_WINDOW, now - HN_KNOWN_POST_WINDOW)
+        posts = await hn_client.get_text_posts(limit, known_posts)
+        for post, status in zip(posts, await run_db(save_posts, "hackernews", posts, now)):
+            post["status"] = status
         return posts
-    except requests.exceptions.HTTPError as e:
+    except HTTPException:
+        raise
+    except httpx.HTTPStatusError as e:
         logger.error(f"HTTPError in get_hacker_news_posts: {e}")
         raise HTTPException(status_code=502, detail="Error fetching data from Hacker News.")
     except Exception as e:
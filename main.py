@@ -1,32 +1,47 @@
 import os
+import json
+import base64
 import time
+import asyncio
 import logging
+import httpx
 import requests
 import secrets
-import sqlite3
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request, Depends
-from jose import JWTError, jwt
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime, timedelta
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse, PlainTextResponse
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
-from apscheduler.schedulers.background import BackgroundScheduler
-from database import init_db
+from database import init_db, cache, run_db, list_summaries, get_summary_from_db, delete_summary_from_db, create_user, create_connected_account, record_topic_request, save_posts, search_summaries, search_posts, prune_derived_summaries
 from reddit import get_reddit_posts, get_trending_topics
 from hackernews import get_hacker_news_posts
-from summarizer import summarize_text
+from url_fetcher import url_fetcher, url_cache_stats
+from metrics import MetricsMiddleware, registry
+from coordination import LeaderLease, LEADER_LEASE_TTL
+from upstream import DeadlineMiddleware, arequest, upstream_stats, deadline
+from precompute import run_precompute
+from summarizer import summarize_text, summarize_document, stream_summary, topic_cache_key, get_fresh_summary, coalescing_stats, generation_stats, cache_key_stats, stale_stats, delta_stats, backend_stats, dedup_stats, summary_is_stale, close_client
 
 load_dotenv()
 
-init_db()
+# Set RATE_LIMIT_ENABLED=false to lift the per-IP limits, e.g. for load tests.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+# Where limit counters live. The default keeps them per process; with several
+# workers use shared storage, e.g. sqlite:///limits.db (see coordination.py).
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+limiter = Limiter(key_func=get_remote_address, enabled=RATE_LIMIT_ENABLED, storage_uri=RATE_LIMIT_STORAGE_URI)
 
-limiter = Limiter(key_func=get_remote_address)
+# Runs the daily precompute job in-process. With several workers every one
+# schedules it, and the scheduler lease lets only one of them run it.
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+scheduler_lease = LeaderLease("scheduler")
 
 # In a real app, this should be a securely stored secret
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -44,6 +59,7 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -70,6 +86,7 @@ def get_current_user(token: str = Depends(HTTPBasic())):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -82,11 +99,48 @@ def get_current_user(token: str = Depends(HTTPBasic())):
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+def summarize_trending_topics():
+    """Summarizes the trending topics from Reddit."""
+    logger.info("Starting daily summary of trending topics...")
+    try:
+        logger.info(f"Pruned {prune_derived_summaries(time.time())} expired content-keyed summaries")
+        result = asyncio.run(_run_precompute_job())
+        logger.info(f"Finished daily summary of trending topics: {result}")
+    except Exception as e:
+        logger.error(f"Error in summarize_trending_topics: {e}")
+
+async def _run_precompute_job():
+    # The job's event loop ends with it, and so must the OpenAI client it opened.
+    try:
+        return await run_precompute()
+    finally:
+        await close_client()
+
+def start_scheduler():
+    from apscheduler.schedulers.background import BackgroundScheduler
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(scheduler_lease.run_if_leader(summarize_trending_topics), 'interval', days=1)
+    # Renewing well within the TTL keeps leadership with one process while it lives.
+    scheduler.add_job(scheduler_lease.renew, 'interval', seconds=LEADER_LEASE_TTL / 3, next_run_time=datetime.now())
+    scheduler.start()
+    return scheduler
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema setup runs at startup rather than import, so importing the app stays cheap.
+    await run_db(init_db)
+    scheduler = start_scheduler() if SCHEDULER_ENABLED else None
+    yield
+    if scheduler is not None:
+        scheduler.shutdown(wait=False)
+        await run_db(scheduler_lease.release)
+
+app = FastAPI(lifespan=lifespan)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
-app.mount("/", StaticFiles(directory="frontend/build", html=True), name="static")
+# Batch items each get their own deadline (see _summarize_batch_item).
+app.add_middleware(DeadlineMiddleware, exclude_paths={"/summarize/batch"})
+app.add_middleware(MetricsMiddleware)
 
 class SummaryRequest(BaseModel):
     topic: str
@@ -105,6 +159,7 @@ class SummaryResponse(BaseModel):
     ui_summary: str
     posts: list[Post]
     timestamp: float
+    stale: bool = False
 
 class UrlRequest(BaseModel):
     url: str
@@ -112,6 +167,9 @@ class UrlRequest(BaseModel):
 class TextRequest(BaseModel):
     text: str
 
+# Timeout for outbound HTTP calls made directly from request handlers.
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+
 def is_valid_topic(topic: str):
     """Checks if a topic is valid."""
     if not topic or not topic.strip() or len(topic.strip()) < 3:
@@ -123,14 +181,17 @@ def is_valid_topic(topic: str):
 async def summarize_url(request: Request, url_request: UrlRequest):
     """Summarizes the content of a given URL."""
     try:
-        res = requests.get(url_request.url)
-        res.raise_for_status()
-        soup = BeautifulSoup(res.text, 'html.parser')
-        text = soup.get_text()
-        posts = [{"title": url_request.url, "text": text, "url": url_request.url}]
-        summary, ui_summary = summarize_text(posts, "URL Content")
-        return {"summary": summary, "ui_summary": ui_summary, "posts": posts, "timestamp": time.time()}
-    except requests.exceptions.HTTPError as e:
+        page = await url_fetcher.fetch(url_request.url)
+        if not page["text"]:
+            raise HTTPException(status_code=422, detail="No text could be extracted from the URL.")
+        title = page["title"] or url_request.url
+        posts = [{"title": title, "text": page["text"], "url": url_request.url}]
+        await run_db(save_posts, "url", posts, time.time())
+        summary, ui_summary = await summarize_document(page["text"], "URL Content", title=title, url=url_request.url)
+        return {"summary": summary, "ui_summary": ui_summary, "posts": posts, "timestamp": time.time(), "stale": summary_is_stale.get()}
+    except HTTPException as e:
+        raise e
+    except httpx.HTTPStatusError as e:
         logger.error(f"HTTPError in summarize_url: {e}")
         raise HTTPException(status_code=502, detail="Error fetching data from URL.")
     except Exception as e:
@@ -152,7 +213,7 @@ async def start_reddit_auth():
 async def reddit_callback(code: str, state: str):
     # Here you would verify the `state` parameter to prevent CSRF.
 
-    auth = requests.auth.HTTPBasicAuth(os.getenv('REDDIT_CLIENT_ID'), os.getenv('REDDIT_CLIENT_SECRET'))
+    auth = (os.getenv('REDDIT_CLIENT_ID'), os.getenv('REDDIT_CLIENT_SECRET'))
     post_data = {
         "grant_type": "authorization_code",
         "code": code,
@@ -160,29 +221,33 @@ async def reddit_callback(code: str, state: str):
     }
     headers = {"User-Agent": os.getenv("REDDIT_USER_AGENT")}
 
-    token_response = requests.post(
-        "https://www.reddit.com/api/v1/access_token",
-        auth=auth,
-        data=post_data,
-        headers=headers
-    )
-    token_data = token_response.json()
+    async with httpx.AsyncClient(timeout=HTTP_TIMEOUT) as http_client:
+        token_response = await arequest(
+            http_client, "reddit", "POST",
+            "https://www.reddit.com/api/v1/access_token",
+            timeout=HTTP_TIMEOUT,
+            auth=auth,
+            data=post_data,
+            headers=headers
+        )
+        token_data = token_response.json()
 
-    # Get user identity
-    headers['Authorization'] = f"bearer {token_data['access_token']}"
-    user_response = requests.get("https://oauth.reddit.com/api/v1/me", headers=headers)
-    user_data = user_response.json()
+        # Get user identity
+        headers['Authorization'] = f"bearer {token_data['access_token']}"
+        user_response = await arequest(http_client, "reddit", "GET", "https://oauth.reddit.com/api/v1/me", timeout=HTTP_TIMEOUT, headers=headers)
+        user_data = user_response.json()
 
     username = user_data['name']
-    user_id = create_user(username)
-
-    create_connected_account(
-        user_id=user_id,
-        platform='reddit',
-        access_token=token_data['access_token'],
-        refresh_token=token_data.get('refresh_token'),
-        expires_at=time.time() + token_data['expires_in'],
-        scope=token_data['scope']
+    user_id = await run_db(create_user, username)
+
+    await run_db(
+        create_connected_account,
+        user_id,
+        'reddit',
+        token_data['access_token'],
+        token_data.get('refresh_token'),
+        time.time() + token_data['expires_in'],
+        token_data['scope'],
     )
 
     # For now, just return a success message.
@@ -199,8 +264,8 @@ async def summarize_text_endpoint(request: Request, text_request: TextRequest):
     """Summarizes a given text."""
     try:
         posts = [{"title": "Raw Text", "text": text_request.text, "url": ""}]
-        summary, ui_summary = summarize_text(posts, "Raw Text")
-        return {"summary": summary, "ui_summary": ui_summary, "posts": posts, "timestamp": time.time()}
+        summary, ui_summary = await summarize_document(text_request.text, "Raw Text", title="Raw Text")
+        return {"summary": summary, "ui_summary": ui_summary, "posts": posts, "timestamp": time.time(), "stale": summary_is_stale.get()}
     except Exception as e:
         logger.error(f"Exception in summarize_text_endpoint: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating summary: {e}")
@@ -208,7 +273,7 @@ async def summarize_text_endpoint(request: Request, text_request: TextRequest):
 @app.get("/trending-topics")
 async def trending_topics():
     """Returns a list of trending topics from Reddit."""
-    return await get_trending_topics()
+    return await run_in_threadpool(get_trending_topics)
 
 @app.get("/summarize-hackernews", response_model=SummaryResponse)
 @limiter.limit("5/minute")
@@ -216,8 +281,8 @@ async def summarize_hackernews(request: Request):
     """Summarizes the top stories from Hacker News."""
     try:
         posts = await get_hacker_news_posts()
-        summary, ui_summary = summarize_text(posts, "Hacker News")
-        return {"summary": summary, "ui_summary": ui_summary, "posts": posts, "timestamp": time.time()}
+        summary, ui_summary = await summarize_text(posts, "Hacker News")
+        return {"summary": summary, "ui_summary": ui_summary, "posts": posts, "timestamp": time.time(), "stale": summary_is_stale.get()}
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -231,10 +296,11 @@ async def summarize_get(request: Request, topic: str, summary_format: str = "tex
     if not is_valid_topic(topic):
         raise HTTPException(status_code=400, detail="Topic must be a non-empty string with at least 3 characters.")
     logger.info(f"Received GET request for topic: {topic}")
+    await run_db(record_topic_request, topic, time.time())
     try:
-        posts = get_reddit_posts(topic)
-        summary, ui_summary = summarize_text(posts, topic, summary_format, sentiment_analysis, summary_length, prompt_template)
-        return {"summary": summary, "ui_summary": ui_summary, "posts": posts, "timestamp": time.time()}
+        posts = await run_in_threadpool(get_reddit_posts, topic)
+        summary, ui_summary = await summarize_text(posts, topic, summary_format, sentiment_analysis, summary_length, prompt_template)
+        return {"summary": summary, "ui_summary": ui_summary, "posts": posts, "timestamp": time.time(), "stale": summary_is_stale.get()}
     except HTTPException as e:
         raise e
     except requests.exceptions.HTTPError as e:
@@ -244,6 +310,34 @@ async def summarize_get(request: Request, topic: str, summary_format: str = "tex
         logger.error(f"Exception in summarize_get: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating summary: {e}")
 
+@app.get("/summarize/stream")
+@limiter.limit("5/minute")
+async def summarize_stream(request: Request, topic: str, summary_format: str = "text", sentiment_analysis: bool = False, summary_length: str = "medium", prompt_template: str = "basic"):
+    """Streams a Reddit topic summary as Server-Sent Events."""
+    if not is_valid_topic(topic):
+        raise HTTPException(status_code=400, detail="Topic must be a non-empty string with at least 3 characters.")
+    logger.info(f"Received stream request for topic: {topic}")
+    await run_db(record_topic_request, topic, time.time())
+    try:
+        posts = await run_in_threadpool(get_reddit_posts, topic)
+    except requests.exceptions.HTTPError as e:
+        logger.error(f"HTTPError in summarize_stream: {e}")
+        raise HTTPException(status_code=502, detail="Error fetching data from Reddit.")
+
+    async def events():
+        yield sse_event("posts", {"posts": posts})
+        try:
+            async for event, data in stream_summary(posts, topic, summary_format, sentiment_analysis, summary_length, prompt_template):
+                yield sse_event(event, data)
+        except Exception as e:
+            logger.error(f"Exception in summarize_stream: {e}")
+            yield sse_event("error", {"detail": f"Error generating summary: {e}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.post("/summarize", response_model=SummaryResponse)
 @limiter.limit("5/minute")
 async def summarize_post(request: Request, summary_request: SummaryRequest):
@@ -251,10 +345,11 @@ async def summarize_post(request: Request, summary_request: SummaryRequest):
     if not is_valid_topic(summary_request.topic):
         raise HTTPException(status_code=400, detail="Topic must be a non-empty string with at least 3 characters.")
     logger.info(f"Received POST request for topic: {summary_request.topic}")
+    await run_db(record_topic_request, summary_request.topic, time.time())
     try:
-        posts = get_reddit_posts(summary_request.topic)
-        summary, ui_summary = summarize_text(posts, summary_request.topic, summary_request.summary_format, summary_request.sentiment_analysis, summary_request.summary_length, summary_request.prompt_template)
-        return {"summary": summary, "ui_summary": ui_summary, "posts": posts, "timestamp": time.time()}
+        posts = await run_in_threadpool(get_reddit_posts, summary_request.topic)
+        summary, ui_summary = await summarize_text(posts, summary_request.topic, summary_request.summary_format, summary_request.sentiment_analysis, summary_request.summary_length, summary_request.prompt_template)
+        return {"summary": summary, "ui_summary": ui_summary, "posts": posts, "timestamp": time.time(), "stale": summary_is_stale.get()}
     except HTTPException as e:
         raise e
     except requests.exceptions.HTTPError as e:
@@ -264,47 +359,187 @@ async def summarize_post(request: Request, summary_request: SummaryRequest):
         logger.error(f"Exception in summarize_post: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating summary: {e}")
 
+# Largest number of topics accepted by /summarize/batch, and how many of their
+# cache misses are fetched and summarized at once across all batch requests.
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+_batch_semaphores = {}
+
+def _batch_semaphore() -> asyncio.Semaphore:
+    # Semaphores belong to the event loop that first uses them.
+    loop = asyncio.get_running_loop()
+    if loop not in _batch_semaphores:
+        _batch_semaphores.clear()
+        _batch_semaphores[loop] = asyncio.Semaphore(BATCH_CONCURRENCY)
+    return _batch_semaphores[loop]
+
+async def _summarize_batch_item(index: int, summary_request: SummaryRequest) -> dict:
+    """Fetches and summarizes one batch topic, turning failures into an error line."""
+    result = {"index": index, "topic": summary_request.topic}
+    try:
+        async with _batch_semaphore():
+            # A deadline per item rather than per request: the batch streams for as long as its items take.
+            with deadline():
+                await run_db(record_topic_request, summary_request.topic, time.time())
+                posts = await run_in_threadpool(get_reddit_posts, summary_request.topic)
+                summary, ui_summary = await summarize_text(posts, summary_request.topic, summary_request.summary_format, summary_request.sentiment_analysis, summary_request.summary_length, summary_request.prompt_template)
+        posts = [{"title": post["title"], "text": post["text"], "url": post["url"]} for post in posts]
+        return {**result, "status": "ok", "cached": False, "summary": summary, "ui_summary": ui_summary, "posts": posts, "timestamp": time.time(), "stale": summary_is_stale.get()}
+    except HTTPException as e:
+        return {**result, "status": "error", "status_code": e.status_code, "detail": e.detail}
+    except requests.exceptions.HTTPError as e:
+        logger.error(f"HTTPError in summarize_batch for topic {summary_request.topic}: {e}")
+        return {**result, "status": "error", "status_code": 502, "detail": "Error fetching data from Reddit."}
+    except Exception as e:
+        logger.error(f"Exception in summarize_batch for topic {summary_request.topic}: {e}")
+        return {**result, "status": "error", "status_code": 500, "detail": f"Error generating summary: {e}"}
+
+@app.post("/summarize/batch")
+@limiter.limit("5/minute")
+async def summarize_batch(request: Request, summary_requests: list[SummaryRequest]):
+    """Summarizes many Reddit topics, streaming one NDJSON line per topic as it completes.
+
+    Fresh cached summaries are sent first without touching Reddit. Each line
+    carries the topic's index in the request; a failed topic gets an error line
+    instead of failing the batch.
+    """
+    if not 1 <= len(summary_requests) <= BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch must contain between 1 and {BATCH_MAX_ITEMS} topics.")
+    logger.info(f"Received batch request for {len(summary_requests)} topics")
+
+    async def lines():
+        # Content keys need the posts, so only topic keys can be checked before fetching.
+        # They are all looked up at once rather than one DB round trip after another.
+        valid = [index for index, summary_request in enumerate(summary_requests) if is_valid_topic(summary_request.topic)]
+        cached_summaries = dict(zip(valid, await asyncio.gather(*(
+            get_fresh_summary(topic_cache_key(item.topic, item.summary_format, item.sentiment_analysis, item.summary_length, item.prompt_template))
+            for item in (summary_requests[index] for index in valid)
+        ))))
+        misses = []
+        for index, summary_request in enumerate(summary_requests):
+            if not is_valid_topic(summary_request.topic):
+                yield ndjson_line({"index": index, "topic": summary_request.topic, "status": "error", "status_code": 400,
+                                   "detail": "Topic must be a non-empty string with at least 3 characters."})
+                continue
+            cached_summary = cached_summaries[index]
+            if cached_summary:
+                summary, ui_summary = cached_summary
+                yield ndjson_line({"index": index, "topic": summary_request.topic, "status": "ok", "cached": True, "summary": summary,
+                                   "ui_summary": ui_summary, "posts": [], "timestamp": time.time(), "stale": False})
+            else:
+                misses.append(asyncio.ensure_future(_summarize_batch_item(index, summary_request)))
+        try:
+            for next_done in asyncio.as_completed(misses):
+                yield ndjson_line(await next_done)
+        finally:
+            # The client went away: stop fetching for topics nobody will read.
+            for task in misses:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def ndjson_line(data: dict) -> str:
+    return json.dumps(data) + "\n"
+
+ADMIN_PAGE_SIZE = 50
+ADMIN_MAX_PAGE_SIZE = 200
+
+def encode_cursor(timestamp: float, topic: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([timestamp, topic]).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        timestamp, topic = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(timestamp), str(topic)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
 @app.get("/admin")
-async def get_admin_summaries(username: str = Depends(get_current_admin_user)):
-    conn = sqlite3.connect('summaries.db')
-    c = conn.cursor()
-    c.execute("SELECT topic, summary, ui_summary, timestamp FROM summaries")
-    summaries = c.fetchall()
-    conn.close()
-    return summaries
+async def get_admin_summaries(cursor: str | None = None, limit: int = ADMIN_PAGE_SIZE, prefix: str | None = None,
+                              max_age: float | None = None, min_age: float | None = None,
+                              username: str = Depends(get_current_admin_user)):
+    """Lists cached summaries newest first, paginated by an opaque cursor."""
+    limit = max(1, min(limit, ADMIN_MAX_PAGE_SIZE))
+    now = time.time()
+    rows = await run_db(
+        list_summaries,
+        limit + 1,
+        decode_cursor(cursor) if cursor else None,
+        prefix,
+        now - max_age if max_age is not None else None,
+        now - min_age if min_age is not None else None,
+    )
+    items = [
+        {"topic": topic, "ui_summary": ui_summary, "summary_preview": summary_preview, "timestamp": timestamp}
+        for topic, ui_summary, summary_preview, timestamp in rows[:limit]
+    ]
+    next_cursor = encode_cursor(items[-1]["timestamp"], items[-1]["topic"]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/admin/summary/{topic:path}")
+async def get_admin_summary(topic: str, username: str = Depends(get_current_admin_user)):
+    result = await run_db(get_summary_from_db, topic)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Summary not found.")
+    summary, ui_summary, timestamp = result
+    return {"topic": topic, "summary": summary, "ui_summary": ui_summary, "timestamp": timestamp}
+
+ADMIN_SEARCH_PAGE_SIZE = 20
+
+@app.get("/admin/search")
+async def search_admin(q: str, scope: str = "summaries", limit: int = ADMIN_SEARCH_PAGE_SIZE, offset: int = 0,
+                       username: str = Depends(get_current_admin_user)):
+    """Full-text search over stored summaries or source posts, best matches first."""
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Search query must not be empty.")
+    limit = max(1, min(limit, ADMIN_MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    if scope == "summaries":
+        rows = await run_db(search_summaries, q, limit + 1, offset)
+        results = [
+            {"topic": topic, "snippet": snippet, "ui_summary": ui_summary, "timestamp": timestamp}
+            for topic, snippet, ui_summary, timestamp in rows[:limit]
+        ]
+    elif scope == "posts":
+        rows = await run_db(search_posts, q, limit + 1, offset)
+        results = [
+            {"source": source, "title": title, "snippet": snippet, "url": url, "last_seen": last_seen}
+            for source, title, snippet, url, last_seen in rows[:limit]
+        ]
+    else:
+        raise HTTPException(status_code=400, detail="Scope must be 'summaries' or 'posts'.")
+    return {"results": results, "next_offset": offset + limit if len(rows) > limit else None}
 
 @app.delete("/admin/delete/{topic}")
 async def delete_summary(topic: str, username: str = Depends(get_current_admin_user)):
-    conn = sqlite3.connect('summaries.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM summaries WHERE topic=?", (topic,))
-    conn.commit()
-    conn.close()
+    await run_db(delete_summary_from_db, topic)
     return {"message": "Summary deleted successfully."}
 
+@app.get("/admin/stats")
+async def get_admin_stats(username: str = Depends(get_current_admin_user)):
+    requests_seen = cache_key_stats["requests"]
+    cache_keys = {
+        **cache_key_stats,
+        "topic_hit_rate": cache_key_stats["topic_hits"] / requests_seen if requests_seen else 0.0,
+        "content_hit_rate": cache_key_stats["content_hits"] / requests_seen if requests_seen else 0.0,
+    }
+    return {"coalescing": coalescing_stats, "memory_cache": cache.stats(), "generation": generation_stats, "cache_keys": cache_keys, "stale": stale_stats, "incremental": delta_stats, "backends": backend_stats, "dedup": dedup_stats, "url_cache": url_cache_stats, "upstreams": upstream_stats()}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 from fastapi.responses import FileResponse
 
 @app.get("/admin-ui")
 async def get_admin_ui():
     return FileResponse("admin.html")
 
+# Mounted last so the catch-all static route does not shadow the API routes above.
+app.mount("/", StaticFiles(directory="frontend/build", html=True), name="static")
+
 if __name__ == "__main__":
     import uvicorn
 
-    def summarize_trending_topics():
-        """Summarizes the trending topics from Reddit."""
-        logger.info("Starting daily summary of trending topics...")
-        try:
-            trending_topics_list = get_trending_topics()
-            for topic in trending_topics_list:
-                posts = get_reddit_posts(topic)
-                summarize_text(posts, topic)
-            logger.info("Finished daily summary of trending topics.")
-        except Exception as e:
-            logger.error(f"Error in summarize_trending_topics: {e}")
-
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(summarize_trending_topics, 'interval', days=1)
-    scheduler.start()
-
     uvicorn.run(app, host="0.0.0.0", port=8000)
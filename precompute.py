@@ -0,0 +1,102 @@
+"""Precomputes summaries for trending and frequently requested topics.
+
+Topics are processed by a bounded pool of workers, each stage under its own
+timeout. Progress is stored per topic, so a run that crashes is resumed where it
+stopped the next time the job starts. Run it on demand with:
+
+    python precompute.py --concurrency 4
+"""
+import os
+import time
+import asyncio
+import argparse
+import logging
+from database import (
+    init_db, run_db, get_topic_request_counts, prune_topic_requests, create_precompute_run,
+    get_unfinished_precompute_run, get_pending_precompute_topics, update_precompute_progress,
+    finish_precompute_run, get_precompute_run_status,
+)
+from reddit import get_reddit_posts, get_trending_topics
+from summarizer import summarize_text
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTE_CONCURRENCY = int(os.getenv("PRECOMPUTE_CONCURRENCY", "4"))
+PRECOMPUTE_FETCH_TIMEOUT = float(os.getenv("PRECOMPUTE_FETCH_TIMEOUT", "30"))
+PRECOMPUTE_SUMMARIZE_TIMEOUT = float(os.getenv("PRECOMPUTE_SUMMARIZE_TIMEOUT", "120"))
+# Requests within this window decide topic priority; older request records are pruned.
+PRECOMPUTE_REQUEST_WINDOW = float(os.getenv("PRECOMPUTE_REQUEST_WINDOW", str(7 * 24 * 3600)))
+# How many of the most requested topics are warmed in addition to the trending ones.
+PRECOMPUTE_TOP_REQUESTED = int(os.getenv("PRECOMPUTE_TOP_REQUESTED", "20"))
+
+def prioritize_topics(trending: list, request_counts: dict, top_requested: int = PRECOMPUTE_TOP_REQUESTED) -> list:
+    """Orders trending and popular topics by recent request count, then by trending rank."""
+    popular = sorted(request_counts, key=request_counts.get, reverse=True)[:top_requested]
+    candidates = list(dict.fromkeys(trending + popular))
+    rank = {topic: i for i, topic in enumerate(candidates)}
+    return sorted(candidates, key=lambda topic: (-request_counts.get(topic, 0), rank[topic]))
+
+async def plan_run() -> int:
+    """Creates a new run over the current trending and most requested topics."""
+    now = time.time()
+    await run_db(prune_topic_requests, now - PRECOMPUTE_REQUEST_WINDOW)
+    trending = await asyncio.wait_for(asyncio.to_thread(get_trending_topics), PRECOMPUTE_FETCH_TIMEOUT)
+    request_counts = await run_db(get_topic_request_counts, now - PRECOMPUTE_REQUEST_WINDOW)
+    topics = prioritize_topics(trending, request_counts)
+    run_id = await run_db(create_precompute_run, topics, now)
+    logger.info(f"Planned precompute run {run_id} with {len(topics)} topics")
+    return run_id
+
+async def precompute_topic(run_id: int, topic: str, fetch_timeout: float, summarize_timeout: float):
+    await run_db(update_precompute_progress, run_id, topic, "running")
+    try:
+        posts = await asyncio.wait_for(asyncio.to_thread(get_reddit_posts, topic), fetch_timeout)
+        # Not in the background: the run's event loop would cancel a refresh still pending when it ends.
+        await asyncio.wait_for(summarize_text(posts, topic, background=False), summarize_timeout)
+    except Exception as e:
+        error = "timed out" if isinstance(e, asyncio.TimeoutError) else str(e) or repr(e)
+        logger.error(f"Precompute failed for topic {topic}: {error}")
+        await run_db(update_precompute_progress, run_id, topic, "failed", error)
+    else:
+        await run_db(update_precompute_progress, run_id, topic, "done")
+
+async def run_precompute(concurrency: int = PRECOMPUTE_CONCURRENCY, resume: bool = True,
+                         fetch_timeout: float = PRECOMPUTE_FETCH_TIMEOUT,
+                         summarize_timeout: float = PRECOMPUTE_SUMMARIZE_TIMEOUT) -> dict:
+    """Runs (or resumes) a precompute run and returns its per-status topic counts."""
+    run_id = await run_db(get_unfinished_precompute_run) if resume else None
+    if run_id is None:
+        run_id = await plan_run()
+    else:
+        logger.info(f"Resuming precompute run {run_id}")
+
+    queue = asyncio.Queue()
+    for topic in await run_db(get_pending_precompute_topics, run_id):
+        queue.put_nowait(topic)
+
+    async def worker():
+        while not queue.empty():
+            topic = queue.get_nowait()
+            await precompute_topic(run_id, topic, fetch_timeout, summarize_timeout)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await run_db(finish_precompute_run, run_id, time.time())
+    status = await run_db(get_precompute_run_status, run_id)
+    logger.info(f"Finished precompute run {run_id}: {status}")
+    return {"run_id": run_id, **status}
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute summaries for trending and popular topics.")
+    parser.add_argument("--concurrency", type=int, default=PRECOMPUTE_CONCURRENCY)
+    parser.add_argument("--fetch-timeout", type=float, default=PRECOMPUTE_FETCH_TIMEOUT)
+    parser.add_argument("--summarize-timeout", type=float, default=PRECOMPUTE_SUMMARIZE_TIMEOUT)
+    parser.add_argument("--no-resume", action="store_true", help="start a new run even if the last one did not finish")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    result = asyncio.run(run_precompute(args.concurrency, not args.no_resume, args.fetch_timeout, args.summarize_timeout))
+    print(result)
+
+if __name__ == "__main__":
+    main()
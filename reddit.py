@@ -1,35 +1,107 @@
 import os
+import time
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from fastapi import HTTPException
 import logging
+from database import save_posts
+from metrics import span
+from upstream import request
 
 logger = logging.getLogger(__name__)
 
 REDDIT_CLIENT_ID = os.getenv("REDDIT_CLIENT_ID")
 REDDIT_CLIENT_SECRET = os.getenv("REDDIT_CLIENT_SECRET")
 REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT")
+REDDIT_BASE_URL = os.getenv("REDDIT_BASE_URL", "https://www.reddit.com")
+REDDIT_OAUTH_URL = os.getenv("REDDIT_OAUTH_URL", "https://oauth.reddit.com")
+
+# Refresh the app-only token this many seconds before Reddit says it expires.
+TOKEN_REFRESH_MARGIN = 60
+POOL_MAXSIZE = 10
+
+class RedditClient:
+    """Reddit API client with a keep-alive connection pool and a cached app-only token.
+
+    Calls go through the upstream policy (timeouts, retries, rate-limit pacing
+    from Reddit's X-Ratelimit headers, circuit breaker).
+    """
+
+    def __init__(self, client_id, client_secret, user_agent, pool_maxsize: int = POOL_MAXSIZE):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.user_agent = user_agent
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+    def _token_is_fresh(self) -> bool:
+        return self._token is not None and time.time() < self._token_expires_at - TOKEN_REFRESH_MARGIN
+
+    def get_access_token(self) -> str:
+        """Returns a cached app-only token, fetching a new one when it is about to expire.
+
+        Only one thread refreshes at a time; threads waiting on the lock pick up
+        the token it minted instead of requesting their own.
+        """
+        if self._token_is_fresh():
+            return self._token
+        with self._token_lock:
+            if self._token_is_fresh():
+                return self._token
+            with span("reddit.token"):
+                # Minting an app-only token has no side effects, so it is safe to retry.
+                res = request(
+                    self.session, "reddit", "POST", f"{REDDIT_BASE_URL}/api/v1/access_token", idempotent=True,
+                    auth=(self.client_id, self.client_secret),
+                    data={"grant_type": "client_credentials"},
+                    headers={"User-Agent": self.user_agent},
+                )
+            res.raise_for_status()
+            token_data = res.json()
+            self._token = token_data["access_token"]
+            self._token_expires_at = time.time() + token_data.get("expires_in", 3600)
+            logger.info("Fetched new Reddit access token")
+            return self._token
+
+    def invalidate_token(self):
+        """Drops the cached token so the next call fetches a new one."""
+        with self._token_lock:
+            self._token = None
+            self._token_expires_at = 0.0
+
+    def oauth_get(self, path: str, params: dict | None = None) -> requests.Response:
+        """Performs an authenticated GET against the OAuth API, retrying once on a rejected token."""
+        for attempt in range(2):
+            headers = {"User-Agent": self.user_agent, "Authorization": f"bearer {self.get_access_token()}"}
+            res = request(self.session, "reddit", "GET", f"{REDDIT_OAUTH_URL}{path}", headers=headers, params=params)
+            if res.status_code == 401 and attempt == 0:
+                self.invalidate_token()
+                continue
+            res.raise_for_status()
+            return res
+
+    def public_get(self, path: str, params: dict | None = None) -> requests.Response:
+        """Performs an unauthenticated GET against the public API."""
+        res = request(self.session, "reddit", "GET", f"{REDDIT_BASE_URL}{path}", headers={"User-Agent": self.user_agent}, params=params)
+        res.raise_for_status()
+        return res
+
+reddit_client = RedditClient(REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET, REDDIT_USER_AGENT)
 
 def get_reddit_posts(topic: str, limit: int = 5):
-    """Fetches posts from Reddit for a given topic."""
-    auth = requests.auth.HTTPBasicAuth(REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET)
-    headers = {"User-Agent": REDDIT_USER_AGENT}
-
-    # Get an access token
-    res = requests.post(
-        "https://www.reddit.com/api/v1/access_token",
-        auth=auth,
-        data={"grant_type": "client_credentials"},
-        headers=headers,
-    )
-    res.raise_for_status()
-    access_token = res.json()["access_token"]
-
-    # Search for posts
-    headers["Authorization"] = f"bearer {access_token}"
-    url = "https://oauth.reddit.com/search"
+    """Fetches posts from Reddit for a given topic and records them in the post store.
+
+    Each post is tagged with its store status: "new", "changed" or "unchanged".
+    """
     params = {"q": topic, "limit": limit, "sort": "top", "type": "link"}
-    res = requests.get(url, headers=headers, params=params)
-    res.raise_for_status()
+    with span("reddit.search"):
+        res = reddit_client.oauth_get("/search", params=params)
 
     posts = res.json()["data"]["children"]
     logger.info(f"Found {len(posts)} posts")
@@ -37,7 +109,7 @@ def get_reddit_posts(topic: str, limit: int = 5):
         raise HTTPException(status_code=404, detail="No Reddit posts found for this topic.")
 
     filtered_posts = [
-        {"title": post["data"]["title"], "text": post["data"].get("selftext", ""), "url": post["data"].get("url", "")}
+        {"id": post["data"].get("id"), "title": post["data"]["title"], "text": post["data"].get("selftext", ""), "url": post["data"].get("url", "")}
         for post in posts
         if post["data"].get("selftext", "").strip()
         and len(post["data"].get("selftext", "").strip()) >= 20
@@ -46,16 +118,23 @@ def get_reddit_posts(topic: str, limit: int = 5):
         and post["data"].get("post_hint") != "link"
     ]
     logger.info(f"Found {len(filtered_posts)} filtered posts")
+    # Search listings carry the post bodies, so there is no per-item fetch to skip;
+    # storing them still tells callers which posts are new or changed.
+    with span("db.save_posts"):
+        statuses = save_posts("reddit", filtered_posts, time.time())
+    for post, status in zip(filtered_posts, statuses):
+        post["status"] = status
     return filtered_posts
 
 def get_trending_topics():
     """Fetches trending topics from Reddit."""
     try:
-        headers = {"User-Agent": REDDIT_USER_AGENT}
-        res = requests.get("https://www.reddit.com/api/trending_subreddits.json", headers=headers)
-        res.raise_for_status()
+        with span("reddit.trending"):
+            res = reddit_client.public_get("/api/trending_subreddits.json")
         data = res.json()
         return [f"r/{subreddit}" for subreddit in data["subreddit_names"]]
+    except HTTPException:
+        raise
     except requests.exceptions.HTTPError as e:
         logger.error(f"HTTPError in get_trending_topics: {e}")
         raise HTTPException(status_code=502, detail="Error fetching trending topics from Reddit.")
@@ -1,31 +1,389 @@
 import os
+import re
+import json
 import time
-import openai
-from database import get_summary_from_db, save_summary_to_db
+import asyncio
+import hashlib
+import functools
+import threading
+import contextvars
+from database import (
+    cache, load_summary_from_db, save_summary_to_db, run_db, CACHE_TTL, SUMMARY_CONTENT_TTL, get_chunk_summaries, save_chunk_summary,
+    post_content_hash, get_summary_post_set, save_summary_post_set,
+)
+from metrics import span, record_cache, record_upstream, record_prompt_tokens_saved
+from extractive import extractive_summary
+from dedup import prepare_posts, trim_text
 import logging
 
 logger = logging.getLogger(__name__)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-CACHE_TTL = 300
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+# JSON mode needs a model that supports response_format.
+OPENAI_STRUCTURED_MODEL = os.getenv("OPENAI_STRUCTURED_MODEL", "gpt-4o")
 
-client = openai.OpenAI(api_key=OPENAI_API_KEY)
+# How the main and UI summaries are generated:
+#   "sequential" - two requests, one after the other
+#   "concurrent" - the same two requests issued in parallel
+#   "structured" - one request returning both summaries as JSON
+SUMMARY_GENERATION_MODE = os.getenv("SUMMARY_GENERATION_MODE", "concurrent")
+GENERATION_MODES = ("sequential", "concurrent", "structured")
+generation_stats = {
+    mode: {"requests": 0, "latency_s": 0.0, "prompt_tokens": 0, "completion_tokens": 0}
+    for mode in GENERATION_MODES
+}
 
-def summarize_text(posts: list, topic: str, summary_format: str = "text", sentiment_analysis: bool = False, summary_length: str = "medium", prompt_template: str = "basic"):
-    """Summarizes text using the OpenAI API."""
+# Inputs longer than SUMMARY_MAX_INPUT_TOKENS are split into chunks of about
+# SUMMARY_CHUNK_TOKENS, summarized in parallel and then reduced.
+SUMMARY_MAX_INPUT_TOKENS = int(os.getenv("SUMMARY_MAX_INPUT_TOKENS", "6000"))
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "1500"))
+SUMMARY_CHUNK_CONCURRENCY = int(os.getenv("SUMMARY_CHUNK_CONCURRENCY", "4"))
+# Reduce rounds after which chunk summaries still over the limit are cut to fit.
+SUMMARY_MAX_REDUCE_DEPTH = int(os.getenv("SUMMARY_MAX_REDUCE_DEPTH", "3"))
+
+# The OpenAI SDK takes most of a second to import, so clients are built on first use.
+# A client's connection pool belongs to the event loop that opened it, and the
+# scheduler runs precompute on its own loop in another thread, so each running
+# loop gets its own client. The first client passes to the next loop once its
+# loop has closed and is the one returned outside any loop, so a patch of
+# `summarizer.client` made before asyncio.run reaches the code it runs.
+_clients: dict[asyncio.AbstractEventLoop, object] = {}
+_default_client = None
+_clients_lock = threading.Lock()
+
+def _new_client():
+    import openai
+    return openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+def get_client():
+    """Returns the OpenAI client for the running event loop."""
+    global _default_client
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    with _clients_lock:
+        for closed in [other for other in _clients if other.is_closed()]:
+            del _clients[closed]
+        if loop in _clients:
+            return _clients[loop]
+        if _default_client is None:
+            _default_client = _new_client()
+        if loop is None:
+            return _default_client
+        _clients[loop] = _new_client() if _default_client in _clients.values() else _default_client
+        return _clients[loop]
+
+async def close_client():
+    """Closes the running loop's client, for loops that end before the process does."""
+    global _default_client
+    with _clients_lock:
+        client = _clients.pop(asyncio.get_running_loop(), None)
+        if client is not None and client is _default_client:
+            _default_client = None
+    if client is not None:
+        await client.close()
+
+def __getattr__(name: str):
+    # Keeps `summarizer.client` working (and patchable) without building the client at import time.
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Summaries currently being generated, keyed by cache key. Concurrent misses
+# for the same key await the first caller's task instead of calling the LLM again.
+_inflight: dict[str, asyncio.Task] = {}
+coalescing_stats = {"leader": 0, "coalesced": 0}
+
+# "content" keys summaries by a hash of the topic, normalized posts and prompt
+# options, so an unchanged post set is not summarized twice within
+# SUMMARY_CONTENT_TTL, however old its topic key is.
+# "topic" is the original topic-plus-options key that expires after CACHE_TTL.
+# Both schemes are looked up on every request so their hit rates can be compared.
+SUMMARY_CACHE_KEYING = os.getenv("SUMMARY_CACHE_KEYING", "content")
+cache_key_stats = {"requests": 0, "topic_hits": 0, "content_hits": 0}
+
+# Stale-while-revalidate: a topic summary up to SUMMARY_STALE_GRACE seconds past
+# CACHE_TTL is returned immediately while a deduplicated background task
+# regenerates it. Older summaries block on regeneration. 0 disables the mode.
+SUMMARY_STALE_GRACE = float(os.getenv("SUMMARY_STALE_GRACE", "0"))
+stale_stats = {"served": 0, "refreshes": 0}
+# Set by summarize_text for the current request so endpoints can flag stale responses.
+summary_is_stale = contextvars.ContextVar("summary_is_stale", default=False)
+
+# Incremental refresh: when most of a topic's posts are ones its previous summary
+# already covers, the model gets that summary plus only the new posts. A full
+# regeneration happens once posts added or removed since then exceed
+# SUMMARY_DELTA_DRIFT of all the posts involved, when posts were only removed,
+# or after SUMMARY_MAX_DELTAS incremental updates in a row. 0 disables the mode.
+SUMMARY_MAX_DELTAS = int(os.getenv("SUMMARY_MAX_DELTAS", "3"))
+SUMMARY_DELTA_DRIFT = float(os.getenv("SUMMARY_DELTA_DRIFT", "0.5"))
+delta_stats = {"full": 0, "delta": 0, "reused": 0}
+
+# Summary backends per prompt template, as "template=backend" pairs, e.g.
+# "ui=extractive,daily=extractive". Templates not listed use SUMMARY_DEFAULT_BACKEND.
+SUMMARY_DEFAULT_BACKEND = os.getenv("SUMMARY_DEFAULT_BACKEND", "llm")
+SUMMARY_BACKENDS = dict(
+    pair.strip().split("=", 1) for pair in os.getenv("SUMMARY_BACKENDS", "").split(",") if "=" in pair
+)
+# Seconds a request waits for an LLM summary before answering with an extractive
+# one instead. The LLM summary still finishes and is cached. 0 disables failover.
+SUMMARY_LLM_LATENCY_BUDGET = float(os.getenv("SUMMARY_LLM_LATENCY_BUDGET", "0"))
+backend_stats = {"llm": 0, "extractive": 0, "failover": 0}
+
+# Totals of the dedup reports (see dedup.prepare_posts) of every generated prompt.
+dedup_stats = {"requests": 0, "posts": 0, "duplicates": 0, "boilerplate_lines": 0, "trimmed": 0, "tokens_before": 0, "tokens_after": 0}
+
+async def summarize_text(posts: list, topic: str, summary_format: str = "text", sentiment_analysis: bool = False, summary_length: str = "medium", prompt_template: str = "basic", cache_key: str | None = None, background: bool = True):
+    """Summarizes posts with the prompt template's backend, the OpenAI API by default.
+
+    With background=False, for callers like precompute whose event loop ends
+    when they return, a stale summary is not served while it is refreshed and a
+    slow LLM is not failed over: the call returns once the new summary is stored.
+    """
     if not posts:
         return "No meaningful posts found to summarize.", ""
 
     # Check cache first
-    cache_key = f"{topic}-{summary_format}-{sentiment_analysis}-{summary_length}-{prompt_template}"
-    cached_summary = get_summary_from_db(cache_key)
+    topic_key = cache_key or topic_cache_key(topic, summary_format, sentiment_analysis, summary_length, prompt_template)
+    content_key = content_cache_key(posts, topic, summary_format, sentiment_analysis, summary_length, prompt_template)
+    summary_is_stale.set(False)
+    cached_summary = await lookup_cached_summary(topic_key, content_key)
+    if cached_summary:
+        logger.info(f"Returning cached summary for topic: {topic}")
+        return cached_summary
+
+    cache_key = content_key if SUMMARY_CACHE_KEYING == "content" else topic_key
+    generate = lambda: _generate_summary(posts, topic, [topic_key, content_key], summary_format, sentiment_analysis, summary_length, prompt_template)
+
+    stale_summary = await get_stale_summary(topic_key) if background else None
+    if stale_summary:
+        logger.info(f"Returning stale summary for topic: {topic}")
+        stale_stats["served"] += 1
+        summary_is_stale.set(True)
+        if _start_generation(cache_key, generate)[1]:
+            stale_stats["refreshes"] += 1
+        return stale_summary
+
+    task, is_leader = _start_generation(cache_key, generate)
+    if is_leader:
+        coalescing_stats["leader"] += 1
+    else:
+        coalescing_stats["coalesced"] += 1
+        logger.info(f"Waiting for in-flight summary for topic: {topic}")
+    if not background:
+        return await asyncio.shield(task)
+    return await _await_generation(task, posts, topic, summary_format, summary_length, prompt_template)
+
+def _start_generation(cache_key: str, generate):
+    """Returns the in-flight generation task for a key, starting one if there is none.
+
+    The second value tells whether this call started the task.
+    """
+    loop = asyncio.get_running_loop()
+    task = _inflight.get(cache_key)
+    if task is not None and task.get_loop() is loop:
+        return task, False
+    task = loop.create_task(generate())
+    _inflight[cache_key] = task
+    task.add_done_callback(lambda done: _finish_inflight(cache_key, done))
+    return task, True
+
+def topic_cache_key(topic: str, summary_format: str, sentiment_analysis: bool, summary_length: str, prompt_template: str) -> str:
+    return f"{topic}-{summary_format}-{sentiment_analysis}-{summary_length}-{prompt_template}"
+
+def content_cache_key(posts: list, topic: str, summary_format: str, sentiment_analysis: bool, summary_length: str, prompt_template: str) -> str:
+    """Hashes the posts' titles and texts, whitespace-normalized and order-independent, with the topic and prompt options."""
+    normalized = sorted([" ".join(post["title"].split()), " ".join(post["text"].split())] for post in posts)
+    # The topic is part of the prompt, so the same posts summarized for another topic are another summary.
+    options = [topic, summary_format, sentiment_analysis, summary_length, prompt_template]
+    digest = hashlib.sha256(json.dumps([options, normalized]).encode()).hexdigest()
+    return f"content-{digest}"
+
+async def get_fresh_summary(cache_key: str, max_age: float | None = CACHE_TTL):
+    """Returns the cached (summary, ui_summary) for a key if it is younger than max_age."""
+    # The in-memory tier is checked inline; only a miss pays for a trip to the DB executor.
+    cached_summary = cache.get(cache_key)
+    record_cache("memory", cached_summary is not None)
+    if cached_summary is None:
+        cached_summary = await run_db(load_summary_from_db, cache_key)
+        record_cache("sqlite", cached_summary is not None)
     if cached_summary:
         summary, ui_summary, timestamp = cached_summary
-        if time.time() - timestamp < CACHE_TTL:
-            logger.info(f"Returning cached summary for topic: {topic}")
+        if max_age is None or time.time() - timestamp < max_age:
             return summary, ui_summary
+    return None
+
+async def get_stale_summary(topic_key: str):
+    """Returns a topic summary that may be served stale, or None outside the grace window."""
+    if SUMMARY_STALE_GRACE <= 0:
+        return None
+    return await get_fresh_summary(topic_key, max_age=CACHE_TTL + SUMMARY_STALE_GRACE)
+
+async def lookup_cached_summary(topic_key: str, content_key: str):
+    """Returns the hit for the configured keying scheme, recording hits for both schemes."""
+    with span("summary.cache_lookup"):
+        topic_hit = await get_fresh_summary(topic_key)
+        content_hit = await get_fresh_summary(content_key, max_age=SUMMARY_CONTENT_TTL)
+    cache_key_stats["requests"] += 1
+    cache_key_stats["topic_hits"] += topic_hit is not None
+    cache_key_stats["content_hits"] += content_hit is not None
+    return content_hit if SUMMARY_CACHE_KEYING == "content" else topic_hit
+
+async def stream_summary(posts: list, topic: str, summary_format: str = "text", sentiment_analysis: bool = False, summary_length: str = "medium", prompt_template: str = "basic"):
+    """Yields (event, data) pairs while the main summary is generated token by token.
+
+    A cache hit, a stale summary within the grace window, or a summary another
+    request is already generating, is sent as a single "cached" event. Otherwise "token" events carry the main summary as
+    it streams, while the UI summary is generated concurrently; backends other
+    than the LLM send the whole summary as one token. They are followed
+    by "ui_summary" and "done", and the result is written to the summaries cache.
+    """
+    if not posts:
+        yield "cached", {"summary": "No meaningful posts found to summarize.", "ui_summary": ""}
+        return
+
+    topic_key = topic_cache_key(topic, summary_format, sentiment_analysis, summary_length, prompt_template)
+    content_key = content_cache_key(posts, topic, summary_format, sentiment_analysis, summary_length, prompt_template)
+    cached_summary = await lookup_cached_summary(topic_key, content_key)
+    cache_key = content_key if SUMMARY_CACHE_KEYING == "content" else topic_key
+    stale_summary = None if cached_summary else await get_stale_summary(topic_key)
+    if stale_summary:
+        stale_stats["served"] += 1
+        generate = lambda: _generate_summary(posts, topic, [topic_key, content_key], summary_format, sentiment_analysis, summary_length, prompt_template)
+        if _start_generation(cache_key, generate)[1]:
+            stale_stats["refreshes"] += 1
+        summary, ui_summary = stale_summary
+        yield "cached", {"summary": summary, "ui_summary": ui_summary, "stale": True}
+        return
+
+    task = _inflight.get(cache_key)
+    if not cached_summary and task is not None and task.get_loop() is asyncio.get_running_loop():
+        coalescing_stats["coalesced"] += 1
+        cached_summary = await asyncio.shield(task)
+    if cached_summary:
+        summary, ui_summary = cached_summary
+        yield "cached", {"summary": summary, "ui_summary": ui_summary}
+        return
+
+    prompt = build_prompt(topic, summary_format, sentiment_analysis, summary_length, prompt_template)
+    sent_posts = prompt_posts(posts, topic)
+    posts_block = build_posts_block(sent_posts)
+    backend_name = backend_for_template(prompt_template)
+    if not isinstance(backends[backend_name], LLMBackend):
+        # Other backends answer at once, so the summary goes out as a single token.
+        summary, ui_summary = await backends[backend_name].summarize(topic, prompt, sent_posts, posts_block, summary_format, summary_length)
+        yield "token", {"text": summary}
+    else:
+        ui_task = asyncio.ensure_future(_complete(
+            "You are a helpful assistant that provides very short summaries.",
+            f"Provide a very short, one-sentence summary of the following posts on the topic '{topic}':\n\n{posts_block}",
+        ))
+        try:
+            stream = await _complete("You are a helpful assistant that summarizes text.", f"{prompt}\n\n{posts_block}", stream=True)
+            parts = []
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield "token", {"text": delta}
+            summary = "".join(parts)
+            ui_summary = (await ui_task).choices[0].message.content
+        finally:
+            ui_task.cancel()
+    backend_stats[backend_name] = backend_stats.get(backend_name, 0) + 1
+    yield "ui_summary", {"ui_summary": ui_summary}
+
+    timestamp = await _store_summary(topic_key, content_key, summary, ui_summary, [post_content_hash(post) for post in posts], 0)
+    yield "done", {"summary": summary, "ui_summary": ui_summary, "timestamp": timestamp}
+
+def _finish_inflight(cache_key: str, task: asyncio.Task):
+    if _inflight.get(cache_key) is task:
+        del _inflight[cache_key]
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Summary generation failed for {cache_key}: {task.exception()}")
+
+async def _generate_summary(posts: list, topic: str, cache_keys: list, summary_format: str, sentiment_analysis: bool, summary_length: str, prompt_template: str):
+    """Generates the main and UI summaries with the template's backend and stores them under every cache key.
+
+    The keys are the topic key and the content key. If the topic's previous
+    summary covers most of the posts, only the new ones are sent along with it
+    (see plan_refresh).
+    """
+    with span("summary.prompt_build"):
+        prompt = build_prompt(topic, summary_format, sentiment_analysis, summary_length, prompt_template)
+    backend_name = backend_for_template(prompt_template)
+    backend = backends[backend_name]
+    topic_key, content_key = cache_keys
+    post_hashes = [post_content_hash(post) for post in posts]
+    previous = cache.get(topic_key) or await run_db(load_summary_from_db, topic_key)
+    post_set = await run_db(get_summary_post_set, topic_key, previous[2]) if previous else None
+    mode, new_posts = plan_refresh(posts, post_hashes, post_set)
+    if mode == "delta" and not backend.incremental:
+        mode = "full"
+    delta_stats[mode] += 1
+
+    if mode == "reused":
+        logger.info(f"Previous summary for {topic} already covers all {len(posts)} posts")
+        summary, ui_summary, _ = previous
+        covered_hashes, delta_count = post_set
+    elif mode == "delta":
+        logger.info(f"Updating summary for {topic} with {len(new_posts)} of {len(posts)} posts")
+        new_posts = prompt_posts(new_posts, topic)
+        posts_block = f"Current summary of earlier posts:\n{previous[0]}\n\nNew posts:\n\n{build_posts_block(new_posts)}"
+        summary, ui_summary = await backend.summarize(topic, f"{prompt} {DELTA_INSTRUCTIONS}", new_posts, posts_block, summary_format, summary_length)
+        covered_hashes, delta_count = set(post_hashes), post_set[1] + 1
+    else:
+        sent_posts = prompt_posts(posts, topic)
+        summary, ui_summary = await backend.summarize(topic, prompt, sent_posts, build_posts_block(sent_posts), summary_format, summary_length)
+        covered_hashes, delta_count = post_hashes, 0
+    if mode != "reused":
+        backend_stats[backend_name] = backend_stats.get(backend_name, 0) + 1
+
+    await _store_summary(topic_key, content_key, summary, ui_summary, covered_hashes, delta_count)
+    return summary, ui_summary
+
+async def _store_summary(topic_key: str, content_key: str, summary: str, ui_summary: str, post_hashes, delta_count: int) -> float:
+    """Saves a new summary under both keys with the posts it covers, returning its timestamp.
 
-    # Main summary prompt
+    `post_hashes` are of every fetched post, duplicates included, since the next
+    fetch is compared against them (see plan_refresh).
+    """
+    timestamp = time.time()
+    for cache_key in (topic_key, content_key):
+        await run_db(save_summary_to_db, cache_key, summary, ui_summary, timestamp)
+    await run_db(save_summary_post_set, topic_key, post_hashes, delta_count, timestamp, content_key)
+    return timestamp
+
+DELTA_INSTRUCTIONS = (
+    "Below is the current summary of earlier posts, followed by new posts. Update the summary "
+    "to reflect the new posts rather than starting over, and keep its format and length."
+)
+
+def plan_refresh(posts: list, post_hashes: list, post_set) -> tuple:
+    """Decides how to refresh a summary given the (hashes, delta count) its previous version covers.
+
+    Returns ("reused" | "delta" | "full", new posts). The previous summary is
+    only reused for exactly the posts it covers: a delta can add posts to a
+    summary but not take out ones that are gone, so removed posts count as drift.
+    """
+    if post_set is None or SUMMARY_MAX_DELTAS <= 0:
+        return "full", posts
+    covered_hashes, delta_count = post_set
+    current_hashes = set(post_hashes)
+    if current_hashes == covered_hashes:
+        return "reused", []
+    new_posts = [post for post, post_hash in zip(posts, post_hashes) if post_hash not in covered_hashes]
+    changed = len(current_hashes - covered_hashes) + len(covered_hashes - current_hashes)
+    if not new_posts or delta_count >= SUMMARY_MAX_DELTAS or changed / len(current_hashes | covered_hashes) > SUMMARY_DELTA_DRIFT:
+        return "full", posts
+    return "delta", new_posts
+
+def build_prompt(topic: str, summary_format: str = "text", sentiment_analysis: bool = False, summary_length: str = "medium", prompt_template: str = "basic") -> str:
+    """Builds the instructions for the main summary, without the posts."""
     if prompt_template == "basic":
         prompt = f"Summarize the following social media posts about {topic} in a concise and neutral tone. Focus on key points, opinions, and emerging trends. Ignore spam or low-quality content."
     elif prompt_template == "sentiment":
@@ -56,35 +414,279 @@ def summarize_text(posts: list, topic: str, summary_format: str = "text", sentim
     else:
         prompt += " The summary should be about 100 words."
 
-    prompt += "\n\n"
-
-    for post in posts:
-        prompt += f"Title: {post['title']}\n"
-        prompt += f"Text: {post['text']}\n\n"
-
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that summarizes text."},
-            {"role": "user", "content": prompt},
-        ],
-    )
-    summary = response.choices[0].message.content
-
-    # UI summary prompt
-    ui_summary_prompt = f"Provide a very short, one-sentence summary of the following posts on the topic '{topic}':\n\n"
-    for post in posts:
-        ui_summary_prompt += f"Title: {post['title']}\n"
-        ui_summary_prompt += f"Text: {post['text']}\n\n"
-
-    ui_summary_response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that provides very short summaries."},
-            {"role": "user", "content": ui_summary_prompt},
-        ],
-    )
-    ui_summary = ui_summary_response.choices[0].message.content
-
-    save_summary_to_db(cache_key, summary, ui_summary, time.time())
-    return summary, ui_summary
+    return prompt
+
+def prompt_posts(posts: list, topic: str) -> list:
+    """Drops near-duplicate posts and boilerplate and trims long posts before they are prompted."""
+    # The per-post cap keeps one long post from crowding out the others. A single
+    # post, such as a page from summarize_document, is left whole: its size is
+    # already bounded by SUMMARY_MAX_INPUT_TOKENS.
+    with span("summary.dedup"):
+        posts, report = prepare_posts(posts, count_tokens, max_tokens=None if len(posts) > 1 else 0)
+    dedup_stats["requests"] += 1
+    for key, value in report.items():
+        dedup_stats[key] += value
+    saved = report["tokens_before"] - report["tokens_after"]
+    record_prompt_tokens_saved(saved)
+    if saved:
+        logger.info(f"Prompt for {topic}: dropped {report['duplicates']} duplicate posts and {report['boilerplate_lines']} "
+                    f"boilerplate lines, trimmed {report['trimmed']} posts, saving {saved} of {report['tokens_before']} tokens")
+    return posts
+
+def build_posts_block(posts: list) -> str:
+    """Formats the posts once so every prompt that embeds them reuses the same string."""
+    return "".join(f"Title: {post['title']}\nText: {post['text']}\n\n" for post in posts)
+
+def _record_generation(mode: str, started: float, responses: list):
+    stats = generation_stats[mode]
+    stats["requests"] += 1
+    stats["latency_s"] += time.perf_counter() - started
+    for response in responses:
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            stats["prompt_tokens"] += int(usage.prompt_tokens or 0)
+            stats["completion_tokens"] += int(usage.completion_tokens or 0)
+
+async def _complete(system: str, user: str, **kwargs):
+    import openai
+    try:
+        response = await get_client().chat.completions.create(
+            model=kwargs.pop("model", OPENAI_MODEL),
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            **kwargs,
+        )
+    except openai.APIStatusError as e:
+        record_upstream("openai", e.status_code)
+        raise
+    except openai.APIError:
+        record_upstream("openai", "error")
+        raise
+    record_upstream("openai", 200)
+    return response
+
+async def generate_summaries(topic: str, prompt: str, posts_block: str, mode: str | None = None):
+    """Generates the main and UI summaries using the configured generation mode."""
+    mode = mode or SUMMARY_GENERATION_MODE
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Unknown summary generation mode: {mode}")
+    started = time.perf_counter()
+
+    if mode == "structured":
+        with span("openai.structured"):
+            response = await _complete(
+                "You are a helpful assistant that summarizes text. Reply with a JSON object "
+                "with two string fields: \"summary\" and \"ui_summary\".",
+                f"{prompt} Put that summary in \"summary\". In \"ui_summary\", provide a very short, "
+                f"one-sentence summary of the same posts on the topic '{topic}'.\n\n{posts_block}",
+                model=OPENAI_STRUCTURED_MODEL,
+                response_format={"type": "json_object"},
+            )
+        content = json.loads(response.choices[0].message.content)
+        _record_generation(mode, started, [response])
+        return content["summary"], content["ui_summary"]
+
+    async def main_request():
+        with span("openai.summary"):
+            return await _complete("You are a helpful assistant that summarizes text.", f"{prompt}\n\n{posts_block}")
+
+    async def ui_request():
+        with span("openai.ui_summary"):
+            return await _complete(
+                "You are a helpful assistant that provides very short summaries.",
+                f"Provide a very short, one-sentence summary of the following posts on the topic '{topic}':\n\n{posts_block}",
+            )
+
+    if mode == "concurrent":
+        response, ui_summary_response = await asyncio.gather(main_request(), ui_request())
+    else:
+        response = await main_request()
+        ui_summary_response = await ui_request()
+    _record_generation(mode, started, [response, ui_summary_response])
+    return response.choices[0].message.content, ui_summary_response.choices[0].message.content
+
+class SummaryBackend:
+    """Produces the (summary, ui_summary) pair for a set of posts.
+
+    `remote` backends call out over the network: they are held to
+    SUMMARY_LLM_LATENCY_BUDGET and fail over to the extractive backend.
+    `incremental` backends can update a previous summary from the new posts only.
+    """
+    remote = False
+    incremental = False
+
+    async def summarize(self, topic: str, prompt: str, posts: list, posts_block: str, summary_format: str, summary_length: str) -> tuple:
+        raise NotImplementedError
+
+class LLMBackend(SummaryBackend):
+    remote = True
+    incremental = True
+
+    async def summarize(self, topic: str, prompt: str, posts: list, posts_block: str, summary_format: str, summary_length: str) -> tuple:
+        return await generate_summaries(topic, prompt, posts_block)
+
+class ExtractiveBackend(SummaryBackend):
+    """Local TextRank summary; ignores the prompt, so sentiment analysis is not included."""
+
+    async def summarize(self, topic: str, prompt: str, posts: list, posts_block: str, summary_format: str, summary_length: str) -> tuple:
+        with span("extractive.summary"):
+            return extractive_summary(posts, summary_format, summary_length)
+
+# Backends by name. Deployments can register their own and select them in SUMMARY_BACKENDS.
+backends = {"llm": LLMBackend(), "extractive": ExtractiveBackend()}
+
+def backend_for_template(prompt_template: str) -> str:
+    """Returns the name of the backend that summarizes posts for a prompt template."""
+    name = SUMMARY_BACKENDS.get(prompt_template, SUMMARY_DEFAULT_BACKEND)
+    if name not in backends:
+        raise ValueError(f"Unknown summary backend: {name}")
+    return name
+
+async def _await_generation(task: asyncio.Task, posts: list, topic: str, summary_format: str, summary_length: str, prompt_template: str):
+    """Waits for a generation task, answering with an extractive summary if a remote backend is too slow or fails.
+
+    The task is shielded, so a caller that goes away, or gives up on the latency
+    budget, does not cancel the generation for everyone else.
+    """
+    if SUMMARY_LLM_LATENCY_BUDGET <= 0 or not backends[backend_for_template(prompt_template)].remote:
+        return await asyncio.shield(task)
+    import openai
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), SUMMARY_LLM_LATENCY_BUDGET)
+    except (asyncio.TimeoutError, openai.APIError) as e:
+        reason = f"over the {SUMMARY_LLM_LATENCY_BUDGET}s budget" if isinstance(e, asyncio.TimeoutError) else str(e)
+        logger.warning(f"Falling back to an extractive summary for {topic}: {reason}")
+        backend_stats["failover"] += 1
+        # Not cached: the LLM summary replaces it once the shielded task finishes.
+        return await backends["extractive"].summarize(topic, "", posts, "", summary_format, summary_length)
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(OPENAI_MODEL)
+    except Exception as e:
+        # Unknown model name, or the BPE file could not be downloaded.
+        logger.warning(f"Falling back to estimated token counts: {e}")
+        return None
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with tiktoken when available, otherwise estimates about 4 characters per token."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+def _split_units(text: str, max_tokens: int):
+    """Yields (unit, separator, tokens) pieces no larger than max_tokens.
+
+    Paragraphs are kept whole when they fit, then split into sentences, and
+    only as a last resort into runs of words.
+    """
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph)
+        if tokens <= max_tokens:
+            yield paragraph, "\n\n", tokens
+            continue
+        separator = "\n\n"
+        for sentence in _SENTENCE_RE.split(paragraph):
+            tokens = count_tokens(sentence)
+            if tokens <= max_tokens:
+                yield sentence, separator, tokens
+                separator = " "
+                continue
+            words, words_tokens = [], 0
+            for word in sentence.split():
+                word_tokens = count_tokens(word) + 1
+                if words and words_tokens + word_tokens > max_tokens:
+                    yield " ".join(words), separator, words_tokens
+                    separator = " "
+                    words, words_tokens = [], 0
+                words.append(word)
+                words_tokens += word_tokens
+            if words:
+                yield " ".join(words), separator, words_tokens
+                separator = " "
+
+def split_into_chunks(text: str, max_tokens: int = SUMMARY_CHUNK_TOKENS) -> list:
+    """Splits text into chunks of at most max_tokens at paragraph or sentence boundaries.
+
+    Once a chunk is half full it may also end after any unit whose hash picks it
+    as a boundary. Those content-defined cut points mean an edit early in a page
+    only changes the chunks around it, so the rest still hit the chunk cache.
+    """
+    chunks, current, current_tokens = [], [], 0
+    for unit, separator, tokens in _split_units(text, max_tokens):
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("".join(current).strip())
+            current, current_tokens = [], 0
+        current.append(separator + unit)
+        current_tokens += tokens
+        if current_tokens >= max_tokens // 2 and hashlib.sha256(unit.encode()).digest()[0] % 4 == 0:
+            chunks.append("".join(current).strip())
+            current, current_tokens = [], 0
+    if current:
+        chunks.append("".join(current).strip())
+    return chunks
+
+def _chunk_prompt(chunk: str, topic: str) -> str:
+    return f"Summarize this section of a longer document about {topic}. Keep the key facts, names and numbers.\n\n{chunk}"
+
+async def _summarize_chunks(chunks: list, topic: str) -> list:
+    """Summarizes chunks in parallel, reusing cached summaries of identical chunks."""
+    prompts = [_chunk_prompt(chunk, topic) for chunk in chunks]
+    hashes = [hashlib.sha256(f"{OPENAI_MODEL}\n{prompt}".encode()).hexdigest() for prompt in prompts]
+    cached = await run_db(get_chunk_summaries, hashes)
+    logger.info(f"Summarizing {len(chunks)} chunks, {len(set(hashes) & cached.keys())} cached")
+    semaphore = asyncio.Semaphore(SUMMARY_CHUNK_CONCURRENCY)
+
+    async def summarize_chunk(prompt: str, content_hash: str) -> str:
+        if content_hash in cached:
+            return cached[content_hash]
+        async with semaphore:
+            with span("openai.chunk"):
+                response = await _complete("You are a helpful assistant that summarizes text.", prompt)
+        summary = response.choices[0].message.content
+        await run_db(save_chunk_summary, content_hash, summary, time.time())
+        return summary
+
+    return await asyncio.gather(*(summarize_chunk(prompt, content_hash) for prompt, content_hash in zip(prompts, hashes)))
+
+async def summarize_document(text: str, topic: str, title: str, url: str = "", summary_format: str = "text", sentiment_analysis: bool = False, summary_length: str = "medium", prompt_template: str = "basic", depth: int = 0):
+    """Summarizes a single document, map-reducing over chunks when it is too long for one prompt.
+
+    Local backends have no prompt limit and take the whole document at once.
+    Chunk summaries that stay over the limit are reduced again, up to
+    SUMMARY_MAX_REDUCE_DEPTH rounds and only while each round shrinks them, and
+    are otherwise cut to fit.
+    """
+    tokens = count_tokens(text)
+    if not backends[backend_for_template(prompt_template)].remote or tokens <= SUMMARY_MAX_INPUT_TOKENS:
+        posts = [{"title": title, "text": text, "url": url}]
+        return await summarize_text(posts, topic, summary_format, sentiment_analysis, summary_length, prompt_template)
+
+    chunks = split_into_chunks(text, SUMMARY_CHUNK_TOKENS)
+    partials = await _summarize_chunks(chunks, topic)
+    combined = "\n\n".join(partials)
+    combined_tokens = count_tokens(combined)
+    if combined_tokens > SUMMARY_MAX_INPUT_TOKENS:
+        if depth < SUMMARY_MAX_REDUCE_DEPTH and combined_tokens < tokens:
+            return await summarize_document(combined, topic, title, url, summary_format, sentiment_analysis, summary_length, prompt_template, depth + 1)
+        logger.warning(f"Chunk summaries for {topic} still take {combined_tokens} tokens after {depth + 1} rounds; cutting them to {SUMMARY_MAX_INPUT_TOKENS}")
+        partials = [trim_text(combined, SUMMARY_MAX_INPUT_TOKENS, count_tokens)]
+
+    posts = [{"title": f"{title} (part {i})", "text": partial, "url": url} for i, partial in enumerate(partials, 1)]
+    options = f"{summary_format}-{sentiment_analysis}-{summary_length}-{prompt_template}"
+    cache_key = "document-" + hashlib.sha256(f"{topic}\n{options}\n{build_posts_block(posts)}".encode()).hexdigest()
+    return await summarize_text(posts, topic, summary_format, sentiment_analysis, summary_length, prompt_template, cache_key=cache_key)
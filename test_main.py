@@ -1,12 +1,38 @@
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import requests_mock
 from main import app, get_reddit_posts, summarize_text, limiter, cache
-from database import init_db, get_summary_from_db, save_summary_to_db
+from summarizer import coalescing_stats, generation_stats, cache_key_stats, split_into_chunks, count_tokens, summarize_document
+from memory_cache import LRUCache
+import summarizer
+import metrics
+from precompute import prioritize_topics, run_precompute
+from database import CACHE_TTL, init_db, close_db, get_summary_from_db, save_summary_to_db, DATABASE_PATH, db_connection, create_precompute_run, update_precompute_progress, save_posts, delete_summary_from_db, ConnectionPool, prune_derived_summaries
+from reddit import reddit_client
+from hackernews import HackerNewsClient, get_hacker_news_posts
+from url_fetcher import UrlFetcher, extract_text
+from extractive import extractive_summary
+from dedup import prepare_posts
+import dedup
+import hackernews
+import upstream
+from coordination import LeaderLease
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import httpx
+import json
 import requests
 import os
+import re
+import sys
 import time
+import subprocess
+import sqlite3
 
 limiter.enabled = False
 
@@ -16,15 +42,22 @@ client = TestClient(app)
 def clear_cache():
     cache.clear()
 
+@pytest.fixture(autouse=True)
+def reset_upstreams():
+    upstream.reset_upstreams()
+
 @pytest.fixture
 def test_db():
     init_db()
     yield
-    if os.path.exists("summaries.db"):
-        os.remove("summaries.db")
+    close_db()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DATABASE_PATH + suffix):
+            os.remove(DATABASE_PATH + suffix)
 
 @pytest.fixture
 def mock_reddit_api():
+    reddit_client.invalidate_token()
     with requests_mock.Mocker() as m:
         m.post(
             "https://www.reddit.com/api/v1/access_token",
@@ -61,13 +94,47 @@ def mock_reddit_api():
         )
         yield m
 
+# Modules that only specific endpoints need; importing the app must not load them.
+LAZY_MODULES = ("openai", "tiktoken", "numpy", "bs4", "lxml", "apscheduler", "jose", "cryptography")
+# Cold-start budget for `import main`, as measured by -X importtime. Wall-clock
+# time depends on the machine, so it is only checked when set (e.g. 1500 in CI).
+STARTUP_IMPORT_BUDGET_MS = os.getenv("STARTUP_IMPORT_BUDGET_MS")
+
+def test_import_main_stays_lazy(tmp_path):
+    env = {**os.environ, "DATABASE_PATH": str(tmp_path / "startup.db"), "OPENAI_API_KEY": "x"}
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True, check=True)
+    imported = dict(
+        (name, int(cumulative)) for cumulative, name in re.findall(r"^import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)$", result.stderr, re.M)
+    )
+    assert [name for name in imported if name.split(".")[0] in LAZY_MODULES] == []
+    if STARTUP_IMPORT_BUDGET_MS:
+        assert imported["main"] / 1000 < float(STARTUP_IMPORT_BUDGET_MS)
+    # Schema setup waits for the lifespan.
+    assert not (tmp_path / "startup.db").exists()
+
+def test_openai_client_per_event_loop():
+    async def job_client():
+        client = summarizer.get_client()
+        await summarizer.close_client()
+        return client
+
+    async def clients():
+        # A job's loop in another thread, as the scheduler runs precompute, gets a client of its own.
+        return summarizer.get_client(), await asyncio.to_thread(asyncio.run, job_client())
+
+    default = summarizer.client
+    app_client, scheduler_client = asyncio.run(clients())
+    assert app_client is default
+    assert scheduler_client is not default and scheduler_client.is_closed()
+
 def test_read_index():
     response = client.get("/")
     assert response.status_code == 200
     assert "Reddit & Hacker News Summarizer" in response.text
 
 
-@patch("main.client.chat.completions.create")
+@patch("summarizer.client.chat.completions.create", new_callable=AsyncMock)
 def test_summarize_get_endpoint(mock_openai_create, mock_reddit_api, test_db):
     mock_openai_create.return_value.choices[0].message.content = "This is a summary."
 
@@ -79,7 +146,7 @@ def test_summarize_get_endpoint(mock_openai_create, mock_reddit_api, test_db):
     # Check that the OpenAI API was called with the correct prompt
     assert mock_openai_create.call_count == 2 # one for summary, one for ui summary
 
-@patch("main.client.chat.completions.create")
+@patch("summarizer.client.chat.completions.create", new_callable=AsyncMock)
 def test_summarize_post_endpoint(mock_openai_create, mock_reddit_api, test_db):
     mock_openai_create.return_value.choices[0].message.content = "This is a summary."
 
@@ -91,7 +158,7 @@ def test_summarize_post_endpoint(mock_openai_create, mock_reddit_api, test_db):
     # Check that the OpenAI API was called with the correct prompt
     assert mock_openai_create.call_count == 2 # one for summary, one for ui summary
 
-@patch("main.client.chat.completions.create")
+@patch("summarizer.client.chat.completions.create", new_callable=AsyncMock)
 def test_summarize_filters_empty_selftext(mock_openai_create, mock_reddit_api, test_db):
     # Override the mock to return one post with empty selftext
     mock_reddit_api.get(
@@ -135,6 +202,61 @@ def test_summarize_filters_empty_selftext(mock_openai_create, mock_reddit_api, t
     # Check that the OpenAI API was called with the correct prompt
     assert mock_openai_create.call_count == 2 # one for summary, one for ui summary
 
+def parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+@patch("summarizer.client.chat.completions.create", new_callable=AsyncMock)
+def test_metrics_and_server_timing(mock_openai_create, mock_reddit_api, test_db):
+    mock_openai_create.return_value.choices[0].message.content = "This is a summary."
+
+    with patch("metrics.SERVER_TIMING_ENABLED", True):
+        response = client.get("/summarize?topic=python")
+    stages = [entry.split(";")[0] for entry in response.headers["server-timing"].split(", ")]
+    for stage in ("reddit.token", "reddit.search", "summary.cache_lookup", "db.load_summary_from_db",
+                  "summary.prompt_build", "openai.summary", "openai.ui_summary", "total"):
+        assert stage in stages
+    assert "server-timing" not in client.get("/summarize?topic=python").headers
+
+    body = client.get("/metrics").text
+    assert 'centrify_stage_seconds_count{stage="openai.summary"}' in body
+    assert 'centrify_http_request_seconds_bucket{method="GET",route="/summarize",status="200",le="+Inf"}' in body
+    assert metrics.upstream_responses.value(upstream="reddit", status="200") >= 2
+    assert metrics.cache_lookups.value(cache="memory", result="hit") >= 1
+
+def test_summarize_stream_endpoint(mock_reddit_api, test_db):
+    async def fake_completion(**kwargs):
+        if kwargs.get("stream"):
+            async def chunks():
+                for text in ["This ", "is ", "a summary."]:
+                    chunk = MagicMock()
+                    chunk.choices[0].delta.content = text
+                    yield chunk
+            return chunks()
+        response = MagicMock()
+        response.choices[0].message.content = "One sentence."
+        return response
+
+    with patch("summarizer.client.chat.completions.create", side_effect=fake_completion) as mock_openai_create:
+        response = client.get("/summarize/stream?topic=python")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_sse(response.text)
+
+        assert [event for event, _ in events] == ["posts", "token", "token", "token", "ui_summary", "done"]
+        assert len(events[0][1]["posts"]) == 2
+        assert events[-1][1]["summary"] == "This is a summary."
+        assert events[-1][1]["ui_summary"] == "One sentence."
+
+        # The completed stream is cached, so a repeat is replayed as one event.
+        mock_openai_create.reset_mock()
+        events = parse_sse(client.get("/summarize/stream?topic=python").text)
+        assert events[1] == ("cached", {"summary": "This is a summary.", "ui_summary": "One sentence."})
+        assert mock_openai_create.call_count == 0
+
 def test_summarize_no_results(mock_reddit_api, test_db):
     # Override the mock to return no posts
     mock_reddit_api.get(
@@ -147,6 +269,75 @@ def test_summarize_no_results(mock_reddit_api, test_db):
     assert response.status_code == 404
     assert response.json() == {"detail": "No Reddit posts found for this topic."}
 
+def test_reddit_token_is_reused(mock_reddit_api, test_db):
+    get_reddit_posts("python")
+    get_reddit_posts("rust")
+
+    token_calls = [r for r in mock_reddit_api.request_history if r.path == "/api/v1/access_token"]
+    assert len(token_calls) == 1
+
+def test_reddit_token_single_flight(mock_reddit_api, test_db):
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(get_reddit_posts, ["python"] * 8))
+
+    token_calls = [r for r in mock_reddit_api.request_history if r.path == "/api/v1/access_token"]
+    assert len(token_calls) == 1
+
+def test_reddit_token_refreshed_before_expiry(mock_reddit_api, test_db):
+    mock_reddit_api.post(
+        "https://www.reddit.com/api/v1/access_token",
+        json={"access_token": "short_token", "token_type": "bearer", "expires_in": 30},
+    )
+    get_reddit_posts("python")
+    get_reddit_posts("python")
+
+    token_calls = [r for r in mock_reddit_api.request_history if r.path == "/api/v1/access_token"]
+    assert len(token_calls) == 2
+
+def test_summarize_batch_streams_ndjson(test_db):
+    save_summary_to_db("cached-topic-text-False-medium-basic", "cached summary", "cached ui", time.time())
+    posts = [{"title": "Post 1", "text": "This is the first post and it is long enough.", "url": "http://test.com/1"}]
+
+    def fetch(topic):
+        if topic == "broken":
+            raise requests.exceptions.HTTPError("Reddit API is down")
+        return posts
+
+    with patch("main.get_reddit_posts", side_effect=fetch) as mock_fetch, \
+         patch("main.summarize_text", new_callable=AsyncMock, return_value=("fresh summary", "fresh ui")):
+        response = client.post("/summarize/batch", json=[
+            {"topic": "python"}, {"topic": "cached-topic"}, {"topic": "a"}, {"topic": "broken"},
+        ])
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = {line["index"]: line for line in map(json.loads, response.text.splitlines())}
+
+    assert lines[0]["status"] == "ok" and lines[0]["summary"] == "fresh summary" and lines[0]["posts"] == posts
+    assert lines[1] == {**lines[1], "status": "ok", "cached": True, "summary": "cached summary"}
+    assert lines[2]["status_code"] == 400
+    assert lines[3] == {**lines[3], "status": "error", "status_code": 502}
+    # The cached and invalid topics never reached Reddit.
+    assert sorted(call.args[0] for call in mock_fetch.call_args_list) == ["broken", "python"]
+
+    assert client.post("/summarize/batch", json=[]).status_code == 400
+
+def test_summarize_batch_items_get_their_own_deadline(test_db):
+    def fetch(topic):
+        # What every upstream call checks before it is made.
+        if upstream.time_left() <= 0:
+            raise upstream.DeadlineExceeded()
+        return [{"title": "Post 1", "text": "This is the first post and it is long enough.", "url": ""}]
+
+    async def slow_summarize(*args, **kwargs):
+        await asyncio.sleep(0.15)
+        return "summary", "ui"
+
+    with patch("upstream.UPSTREAM_DEADLINE", 0.3), patch("main.BATCH_CONCURRENCY", 1), \
+            patch("main.get_reddit_posts", side_effect=fetch), patch("main.summarize_text", side_effect=slow_summarize):
+        response = client.post("/summarize/batch", json=[{"topic": f"topic-{i}"} for i in range(5)])
+    # The batch takes 0.75s in all, well past a single request's deadline.
+    assert [json.loads(line)["status"] for line in response.text.splitlines()] == ["ok"] * 5
+
 def test_summarize_invalid_topic(test_db):
     response = client.get("/summarize?topic=a")
     assert response.status_code == 400
@@ -182,6 +373,9 @@ def test_get_trending_topics(requests_mock):
     assert response.status_code == 200
     assert response.json() == ["r/news", "r/gaming"]
 
+    with patch("reddit.reddit_client.public_get", side_effect=upstream.UpstreamUnavailable("Reddit is unavailable.")):
+        assert client.get("/trending-topics").status_code == 503
+
 @patch("main.get_hacker_news_posts")
 def test_summarize_hackernews(mock_get_hacker_news_posts, test_db):
     mock_get_hacker_news_posts.return_value = [{"title": "Test Post", "text": "This is a test post.", "url": "http://test.com"}]
@@ -191,6 +385,574 @@ def test_summarize_hackernews(mock_get_hacker_news_posts, test_db):
         assert response.status_code == 200
         assert response.json()["summary"] == "This is a summary."
 
+def mock_hn_transport(story_count=20, text_every=3, slow_ids=()):
+    async def handler(request):
+        if request.url.path.endswith("/topstories.json"):
+            return httpx.Response(200, json=list(range(1, story_count + 1)))
+        item_id = int(request.url.path.rsplit("/", 1)[1].split(".")[0])
+        if item_id in slow_ids:
+            await asyncio.sleep(1)
+        item = {"id": item_id, "title": f"Story {item_id}", "url": f"http://test.com/{item_id}"}
+        if item_id % text_every == 0:
+            item["text"] = f"Text of story {item_id}"
+        return httpx.Response(200, json=item)
+    return httpx.MockTransport(handler)
+
+def test_hackernews_client_skips_non_text_stories():
+    hn = HackerNewsClient(base_url="http://hn.test/v0", max_concurrency=4, transport=mock_hn_transport())
+    posts = asyncio.run(hn.get_text_posts(limit=5))
+    assert [post["title"] for post in posts] == ["Story 3", "Story 6", "Story 9", "Story 12", "Story 15"]
+
+def test_hackernews_client_item_timeout():
+    hn = HackerNewsClient(base_url="http://hn.test/v0", item_timeout=0.1, transport=mock_hn_transport(slow_ids={3}))
+    posts = asyncio.run(hn.get_text_posts(limit=2))
+    assert [post["title"] for post in posts] == ["Story 6", "Story 9"]
+
+    # Skipped items' timeouts say nothing about the host's health, so they never open its breaker.
+    slow_ids = set(range(1, upstream.BREAKER_FAILURES + 3))
+    hn = HackerNewsClient(base_url="http://hn.test/v0", item_timeout=0.1, transport=mock_hn_transport(slow_ids=slow_ids))
+    posts = asyncio.run(hn.get_text_posts(limit=1))
+    assert posts[0]["title"] == "Story 9"
+    assert upstream.upstream_stats()["hn.test"]["breaker"] == "closed"
+
+def test_upstream_retries_and_paces_from_rate_limit_headers():
+    session = requests.Session()
+    with requests_mock.Mocker() as m, patch("upstream.UPSTREAM_BACKOFF_BASE", 0):
+        m.get("https://api.test/data", [
+            {"status_code": 503},
+            {"status_code": 200, "json": {"ok": True}, "headers": {"X-Ratelimit-Remaining": "100", "X-Ratelimit-Reset": "50"}},
+        ])
+        m.post("https://api.test/data", status_code=503)
+        assert upstream.request(session, "test", "GET", "https://api.test/data").json() == {"ok": True}
+        assert m.call_count == 2
+        assert upstream.upstream_stats()["api.test"]["rate_per_s"] == 2.0
+
+        # Non-idempotent calls get a single attempt.
+        assert upstream.request(session, "test", "POST", "https://api.test/data").status_code == 503
+        assert m.call_count == 3
+
+    # An exhausted quota waits for the reset.
+    bucket = upstream.TokenBucket()
+    bucket.update(0, 5)
+    assert 4.9 < bucket.reserve() <= 5
+
+def test_upstream_circuit_breaker_and_deadline():
+    session = requests.Session()
+    with requests_mock.Mocker() as m, patch("upstream.UPSTREAM_BACKOFF_BASE", 0), patch("upstream.UPSTREAM_RETRIES", 0):
+        m.get("https://down.test/", status_code=500)
+        for _ in range(upstream.BREAKER_FAILURES):
+            upstream.request(session, "test", "GET", "https://down.test/")
+        with pytest.raises(upstream.UpstreamUnavailable):
+            upstream.request(session, "test", "GET", "https://down.test/")
+        assert m.call_count == upstream.BREAKER_FAILURES
+        assert upstream.upstream_stats()["down.test"]["breaker"] == "open"
+
+        m.get("https://up.test/", status_code=200)
+        with upstream.deadline(0), pytest.raises(upstream.DeadlineExceeded):
+            upstream.request(session, "test", "GET", "https://up.test/")
+
+def test_reddit_posts_report_store_status(mock_reddit_api, test_db):
+    assert [post["status"] for post in get_reddit_posts("python")] == ["new", "new"]
+    assert [post["status"] for post in get_reddit_posts("python")] == ["unchanged", "unchanged"]
+
+    mock_reddit_api.get("https://oauth.reddit.com/search", json={"data": {"children": [
+        {"data": {"title": "Post 1", "selftext": "This is the first post, edited to be longer.", "url": "http://test.com/1"}},
+    ]}})
+    assert [post["status"] for post in get_reddit_posts("python")] == ["changed"]
+    with db_connection() as conn:
+        first_seen, last_seen = conn.execute("SELECT first_seen, last_seen FROM posts WHERE external_id='http://test.com/1'").fetchone()
+    assert first_seen < last_seen
+
+def test_hackernews_skips_fetch_for_settled_posts(test_db):
+    requested = []
+    transport = mock_hn_transport()
+
+    async def handler(request):
+        requested.append(request.url.path)
+        return await transport.handle_async_request(request)
+
+    hn = HackerNewsClient(base_url="http://hn.test/v0", transport=httpx.MockTransport(handler))
+    with patch.object(hackernews, "hn_client", hn):
+        posts = asyncio.run(get_hacker_news_posts(limit=2))
+        assert [post["status"] for post in posts] == ["new", "new"]
+
+        # Once past the edit window the stored copies are used instead of the item endpoint.
+        with patch.object(hackernews, "HN_EDIT_WINDOW", -1):
+            requested.clear()
+            posts = asyncio.run(get_hacker_news_posts(limit=2))
+    assert [post["title"] for post in posts] == ["Story 3", "Story 6"]
+    assert [post["status"] for post in posts] == ["unchanged", "unchanged"]
+    assert "/v0/item/3.json" not in requested and "/v0/item/6.json" not in requested
+
+PAGE_HTML = b"""<html><head><title>A Page</title><script>var tracking = 1;</script><style>p {}</style></head>
+<body><nav>Home | About</nav><article><h1>Headline</h1><p>First paragraph of the article.</p><p>Second one.</p></article>
+<footer>Copyright</footer></body></html>"""
+
+def test_extract_text_keeps_main_content():
+    title, text = extract_text(PAGE_HTML)
+    assert title == "A Page"
+    assert text == "Headline\nFirst paragraph of the article.\nSecond one."
+    assert extract_text(b"<!-- x -->", "text/html") == ("", "")
+
+def test_url_fetcher_revalidates_and_enforces_limits(test_db):
+    requests_seen = []
+
+    def handler(request):
+        requests_seen.append(request)
+        if request.url.path == "/image.png":
+            return httpx.Response(200, headers={"content-type": "image/png"}, content=b"\x89PNG")
+        if request.url.path == "/huge":
+            return httpx.Response(200, headers={"content-type": "text/plain"}, content=b"word " * 1000)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, headers={"content-type": "text/html; charset=utf-8", "etag": '"v1"'}, content=PAGE_HTML)
+
+    fetcher = UrlFetcher(max_bytes=1000, transport=httpx.MockTransport(handler))
+    first = asyncio.run(fetcher.fetch("http://pages.test/article"))
+    second = asyncio.run(fetcher.fetch("http://pages.test/article"))
+    assert first == second == {"title": "A Page", "text": "Headline\nFirst paragraph of the article.\nSecond one.", "url": "http://pages.test/article"}
+    # The repeat fetch was a conditional GET answered with a 304.
+    assert requests_seen[1].headers["if-none-match"] == '"v1"'
+
+    assert len(asyncio.run(fetcher.fetch("http://pages.test/huge"))["text"]) < 1000
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(fetcher.fetch("http://pages.test/image.png"))
+    assert error.value.status_code == 415
+
+def test_concurrent_summaries_do_not_block(test_db):
+    async def slow_completion(**kwargs):
+        await asyncio.sleep(0.25)
+        response = MagicMock()
+        response.choices[0].message.content = "This is a summary."
+        return response
+
+    async def summarize_concurrently(count):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as async_client:
+            start = time.perf_counter()
+            responses = await asyncio.gather(
+                *(async_client.get("/summarize", params={"topic": f"topic-{i}"}) for i in range(count))
+            )
+            return time.perf_counter() - start, responses
+
+    posts = [{"title": "Post 1", "text": "This is the first post and it is long enough.", "url": "http://test.com/1"}]
+    with patch("summarizer.client.chat.completions.create", side_effect=slow_completion), \
+            patch("main.get_reddit_posts", return_value=posts):
+        single_elapsed, _ = asyncio.run(summarize_concurrently(1))
+        elapsed, responses = asyncio.run(summarize_concurrently(10))
+
+    assert all(response.status_code == 200 for response in responses)
+    # Ten summaries served one at a time would take ten times as long as one.
+    assert elapsed < single_elapsed * 3
+
+def test_summarize_text_coalesces_identical_requests(test_db):
+    calls = 0
+
+    async def slow_completion(**kwargs):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.1)
+        response = MagicMock()
+        response.choices[0].message.content = "This is a summary."
+        return response
+
+    posts = [{"title": "Post 1", "text": "This is the first post and it is long enough.", "url": "http://test.com/1"}]
+
+    async def summarize_concurrently():
+        return await asyncio.gather(*(summarize_text(posts, "coalesced") for _ in range(5)))
+
+    leader_before, coalesced_before = coalescing_stats["leader"], coalescing_stats["coalesced"]
+    with patch("summarizer.client.chat.completions.create", side_effect=slow_completion):
+        results = asyncio.run(summarize_concurrently())
+
+    assert results == [("This is a summary.", "This is a summary.")] * 5
+    assert calls == 2 # one main and one ui summary for the whole group
+    assert coalescing_stats["leader"] - leader_before == 1
+    assert coalescing_stats["coalesced"] - coalesced_before == 4
+
+def test_summarize_text_coalesced_error(test_db):
+    async def failing_completion(**kwargs):
+        await asyncio.sleep(0.1)
+        raise Exception("OpenAI API is down")
+
+    posts = [{"title": "Post 1", "text": "This is the first post and it is long enough.", "url": "http://test.com/1"}]
+
+    async def summarize_concurrently():
+        return await asyncio.gather(*(summarize_text(posts, "failing") for _ in range(3)), return_exceptions=True)
+
+    with patch("summarizer.client.chat.completions.create", side_effect=failing_completion) as mock_openai_create:
+        results = asyncio.run(summarize_concurrently())
+    assert all(str(result) == "OpenAI API is down" for result in results)
+    assert mock_openai_create.call_count == 2 # a single main + ui summary attempt
+
+@patch("summarizer.client.chat.completions.create", new_callable=AsyncMock)
+def test_structured_generation_mode(mock_openai_create, test_db):
+    mock_openai_create.return_value.choices[0].message.content = '{"summary": "This is a summary.", "ui_summary": "One sentence."}'
+    posts = [{"title": "Post 1", "text": "This is the first post and it is long enough.", "url": "http://test.com/1"}]
+
+    with patch("summarizer.SUMMARY_GENERATION_MODE", "structured"):
+        summary, ui_summary = asyncio.run(summarize_text(posts, "structured"))
+
+    assert (summary, ui_summary) == ("This is a summary.", "One sentence.")
+    assert mock_openai_create.call_count == 1
+    assert mock_openai_create.call_args.kwargs["response_format"] == {"type": "json_object"}
+    assert "Title: Post 1" in mock_openai_create.call_args.kwargs["messages"][1]["content"]
+
+@patch("summarizer.client.chat.completions.create", new_callable=AsyncMock)
+def test_generation_modes_send_same_prompts(mock_openai_create, test_db):
+    mock_openai_create.return_value.choices[0].message.content = "This is a summary."
+    posts = [{"title": "Post 1", "text": "This is the first post and it is long enough.", "url": "http://test.com/1"}]
+
+    prompts = {}
+    for mode in ("sequential", "concurrent"):
+        mock_openai_create.reset_mock()
+        with patch("summarizer.SUMMARY_GENERATION_MODE", mode), patch("summarizer.SUMMARY_CACHE_KEYING", "topic"):
+            asyncio.run(summarize_text(posts, f"{mode}-topic"))
+        prompts[mode] = sorted(call.kwargs["messages"][1]["content"].replace(f"{mode}-topic", "TOPIC") for call in mock_openai_create.call_args_list)
+
+    assert prompts["sequential"] == prompts["concurrent"]
+    assert generation_stats["concurrent"]["requests"] >= 1
+
+@patch("summarizer.client.chat.completions.create", new_callable=AsyncMock)
+def test_content_keyed_cache_outlives_topic_ttl(mock_openai_create, test_db):
+    mock_openai_create.return_value.choices[0].message.content = "This is a summary."
+    posts = [{"title": "Post 1", "text": "This is the first post and it is long enough.", "url": "http://test.com/1"}]
+    reordered_posts = [{"title": " Post 1", "text": "This is the first post  and it is long enough.", "url": "http://other.com/1"}]
+
+    asyncio.run(summarize_text(posts, "first-topic"))
+    assert mock_openai_create.call_count == 2
+
+    stats_before = dict(cache_key_stats)
+    # Same normalized content for the same topic, long after CACHE_TTL: no LLM calls.
+    cache.clear()
+    with patch("summarizer.time.time", return_value=time.time() + 10 * 3600):
+        asyncio.run(summarize_text(reordered_posts, "first-topic"))
+    assert mock_openai_create.call_count == 2
+    assert cache_key_stats["content_hits"] - stats_before["content_hits"] == 1
+    assert cache_key_stats["topic_hits"] - stats_before["topic_hits"] == 0
+
+    # The topic is part of the prompt, so another topic is a miss, and so is content past SUMMARY_CONTENT_TTL.
+    asyncio.run(summarize_text(posts, "second-topic"))
+    assert mock_openai_create.call_count == 4
+    content_hits = cache_key_stats["content_hits"]
+    cache.clear()
+    with patch("summarizer.time.time", return_value=time.time() + summarizer.SUMMARY_CONTENT_TTL + 1):
+        asyncio.run(summarize_text(posts, "first-topic"))
+    assert cache_key_stats["content_hits"] == content_hits
+
+    # Changed content is a miss even though the topic key is still fresh.
+    calls = mock_openai_create.call_count
+    changed_posts = [{"title": "Post 1", "text": "This post has been edited since.", "url": "http://test.com/1"}]
+    asyncio.run(summarize_text(changed_posts, "first-topic"))
+    assert mock_openai_create.call_count == calls + 2
+
+@patch("summarizer.client.chat.completions.create", new_callable=AsyncMock)
+def test_stale_while_revalidate(mock_openai_create, test_db):
+    mock_openai_create.return_value.choices[0].message.content = "This is a summary."
+    posts = [{"title": "Post 1", "text": "This is the first post and it is long enough.", "url": "http://test.com/1"}]
+    topic_key = "swr-topic-text-False-medium-basic"
+
+    async def summarize_and_refresh():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as async_client:
+            response = await async_client.get("/summarize", params={"topic": "swr-topic"})
+        await asyncio.gather(*summarizer._inflight.values())
+        return response
+
+    save_summary_to_db(topic_key, "old summary", "old ui summary", time.time() - CACHE_TTL - 10)
+    with patch("summarizer.SUMMARY_STALE_GRACE", 60), patch("main.get_reddit_posts", return_value=posts):
+        response = asyncio.run(summarize_and_refresh())
+
+        assert response.json()["summary"] == "old summary"
+        assert response.json()["stale"] is True
+        # The refresh ran in the background and replaced the stale entry.
+        assert mock_openai_create.call_count == 2
+        assert get_summary_from_db(topic_key)[0] == "This is a summary."
+
+        # Past the grace window the request blocks on regeneration as before.
+        mock_openai_create.reset_mock()
+        cache.clear()
+        save_summary_to_db(topic_key, "old summary", "old ui summary", time.time() - CACHE_TTL - 120)
+        with patch("summarizer.SUMMARY_CACHE_KEYING", "topic"):
+            response = asyncio.run(summarize_and_refresh())
+        assert response.json()["summary"] == "This is a summary."
+        assert response.json()["stale"] is False
+        assert mock_openai_create.call_count == 2
+
+@patch("summarizer.client.chat.completions.create", new_callable=AsyncMock)
+def test_incremental_summary_sends_only_new_posts(mock_openai_create, test_db):
+    mock_openai_create.return_value.choices[0].message.content = "This is a summary."
+    posts = [{"title": f"Post {i}", "text": f"This is post number {i} and it is long enough.", "url": ""} for i in range(4)]
+    topic_key = "delta-topic-text-False-medium-basic"
+
+    def expire_topic_summary():
+        cache.clear()
+        with db_connection() as conn, conn:
+            conn.execute("UPDATE summaries SET timestamp = timestamp - ? WHERE topic=?", (CACHE_TTL + 1, topic_key))
+            conn.execute("UPDATE summary_post_sets SET timestamp = timestamp - ? WHERE cache_key=?", (CACHE_TTL + 1, topic_key))
+
+    def sent_prompts():
+        return [call.kwargs["messages"][1]["content"] for call in mock_openai_create.call_args_list]
+
+    with patch("summarizer.SUMMARY_CACHE_KEYING", "topic"):
+        asyncio.run(summarize_text(posts, "delta-topic"))
+        assert all("Post 0" in prompt for prompt in sent_prompts())
+
+        # One new post out of four: the previous summary plus only that post are sent.
+        expire_topic_summary()
+        mock_openai_create.reset_mock()
+        posts[0] = {"title": "Post 9", "text": "A brand new post that showed up later.", "url": ""}
+        asyncio.run(summarize_text(posts, "delta-topic"))
+        for prompt in sent_prompts():
+            assert "Current summary of earlier posts:\nThis is a summary." in prompt
+            assert "Post 9" in prompt and "Post 1" not in prompt
+
+        # The posts already covered need no model call at all.
+        expire_topic_summary()
+        mock_openai_create.reset_mock()
+        asyncio.run(summarize_text(posts, "delta-topic"))
+        assert mock_openai_create.call_count == 0
+
+        # A delta cannot take a removed post out of the summary, so it is regenerated.
+        expire_topic_summary()
+        mock_openai_create.reset_mock()
+        asyncio.run(summarize_text(posts[1:], "delta-topic"))
+        assert mock_openai_create.call_count == 2
+        assert not any("Current summary" in prompt for prompt in sent_prompts())
+
+        # Past the drift threshold the summary is regenerated from scratch.
+        expire_topic_summary()
+        mock_openai_create.reset_mock()
+        posts[1:] = [{"title": f"Post {i}", "text": f"Another new post, number {i}, long enough.", "url": ""} for i in range(10, 13)]
+        asyncio.run(summarize_text(posts, "delta-topic"))
+        assert mock_openai_create.call_count == 2
+        assert not any("Current summary" in prompt for prompt in sent_prompts())
+
+def test_streamed_summary_covers_duplicate_posts(test_db):
+    async def fake_completion(**kwargs):
+        if kwargs.get("stream"):
+            async def chunks():
+                chunk = MagicMock()
+                chunk.choices[0].delta.content = "This is a summary."
+                yield chunk
+            return chunks()
+        response = MagicMock()
+        response.choices[0].message.content = "One sentence."
+        return response
+
+    async def stream(posts):
+        return [event async for event, _ in summarizer.stream_summary(posts, "dup-topic")]
+
+    post = {"title": "Post 1", "text": "This is the first post and it is long enough.", "url": ""}
+    posts = [post, {**post, "text": post["text"] + " Crossposted."}, {"title": "Post 2", "text": "Another post that is long enough.", "url": ""}]
+    topic_key = "dup-topic-text-False-medium-basic"
+    with patch("summarizer.client.chat.completions.create", side_effect=fake_completion) as mock_openai_create, \
+            patch("summarizer.SUMMARY_CACHE_KEYING", "topic"):
+        assert asyncio.run(stream(posts))[-1] == "done"
+        cache.clear()
+        with db_connection() as conn, conn:
+            conn.execute("UPDATE summaries SET timestamp = timestamp - ? WHERE topic=?", (CACHE_TTL + 1, topic_key))
+            conn.execute("UPDATE summary_post_sets SET timestamp = timestamp - ? WHERE cache_key=?", (CACHE_TTL + 1, topic_key))
+
+        # The crosspost dropped from the prompt is still covered, so the same fetch reuses the summary.
+        mock_openai_create.reset_mock()
+        reused = summarizer.delta_stats["reused"]
+        asyncio.run(summarize_text(posts, "dup-topic"))
+        assert summarizer.delta_stats["reused"] == reused + 1
+        assert mock_openai_create.call_count == 0
+
+def test_extractive_summary_picks_central_sentences():
+    posts = [
+        {"title": "Rust release brings faster compile times", "text": "The new Rust release makes compile times much faster. Compile times matter for large Rust projects. Faster compile times in this release help every Rust team. My cat likes sitting on the keyboard today.", "url": ""},
+        {"title": "Benchmarks of the Rust release", "text": "Independent benchmarks confirm the faster compile times in the Rust release. Some people still prefer the old syntax highlighting theme.", "url": ""},
+        {"title": "Off topic", "text": "The weather was rainy all weekend long here. Someone asked where to buy good coffee beans nearby. A user posted photos of their vacation in Spain.", "url": ""},
+    ]
+    summary, ui_summary = extractive_summary(posts, summary_length="short")
+    assert "compile times" in summary
+    assert not any(word in summary for word in ("cat", "weather", "coffee", "vacation"))
+    assert "Rust" in ui_summary
+
+    bullets, _ = extractive_summary(posts, summary_format="bullets")
+    assert all(line.startswith("- ") for line in bullets.splitlines())
+    assert extractive_summary([{"title": "Hi", "text": "", "url": ""}]) == ("Hi", "Hi")
+
+def test_summary_backend_per_template(test_db):
+    posts = [{"title": "Post 1", "text": "This is the first post and it is long enough to summarize.", "url": ""}]
+    with patch("summarizer.SUMMARY_BACKENDS", {"ui": "extractive"}), \
+            patch("summarizer.client.chat.completions.create", new_callable=AsyncMock) as mock_openai_create:
+        summary, _ = asyncio.run(summarize_text(posts, "backends", prompt_template="ui"))
+        assert mock_openai_create.call_count == 0
+        assert summary == "This is the first post and it is long enough to summarize."
+
+        mock_openai_create.return_value.choices[0].message.content = "LLM summary."
+        assert asyncio.run(summarize_text(posts, "backends", prompt_template="basic")) == ("LLM summary.", "LLM summary.")
+        assert mock_openai_create.call_count == 2
+
+    with patch("summarizer.SUMMARY_DEFAULT_BACKEND", "unknown"), pytest.raises(ValueError):
+        asyncio.run(summarize_text(posts, "backends", prompt_template="daily"))
+
+def test_llm_failover_to_extractive(test_db):
+    async def slow_completion(**kwargs):
+        await asyncio.sleep(0.3)
+        response = MagicMock()
+        response.choices[0].message.content = "LLM summary."
+        return response
+
+    posts = [{"title": "Post 1", "text": "This is the first post and it is long enough to summarize.", "url": ""}]
+
+    async def summarize_then_wait():
+        result = await summarize_text(posts, "failover")
+        await asyncio.sleep(0.5)
+        return result
+
+    failovers_before = summarizer.backend_stats["failover"]
+    with patch("summarizer.SUMMARY_LLM_LATENCY_BUDGET", 0.05), \
+            patch("summarizer.client.chat.completions.create", side_effect=slow_completion):
+        summary, _ = asyncio.run(summarize_then_wait())
+        assert summary == "This is the first post and it is long enough to summarize."
+        assert summarizer.backend_stats["failover"] - failovers_before == 1
+        # The LLM summary finished in the background and replaces the fallback.
+        assert asyncio.run(summarize_text(posts, "failover")) == ("LLM summary.", "LLM summary.")
+
+def test_prepare_posts_drops_duplicates_and_boilerplate():
+    footer = "I am a bot, and this action was performed automatically."
+    body = "The new release improves startup time and memory use across the board for most workloads."
+    posts = [
+        {"title": "New release is out", "text": f"{body}\n{footer}", "url": "http://test.com/1"},
+        {"title": "[Crosspost] New release is out", "text": f"{body} Edit: typo.\n{footer}", "url": "http://test.com/2"},
+        {"title": "Migration question", "text": f"How do I migrate my config files?\n{footer}", "url": "http://test.com/3"},
+        {"title": "Long post", "text": "word " * 2000, "url": "http://test.com/4"},
+    ]
+    prepared, report = prepare_posts(posts, count_tokens, max_tokens=100)
+    assert [post["url"] for post in prepared] == ["http://test.com/1", "http://test.com/3", "http://test.com/4"]
+    assert prepared[1]["text"] == "How do I migrate my config files?"
+    assert count_tokens(prepared[2]["text"]) <= 100 and prepared[2]["text"].endswith("[...]")
+    assert report["duplicates"] == 1 and report["boilerplate_lines"] == 1 and report["trimmed"] == 1
+    assert report["tokens_before"] - report["tokens_after"] > 1500
+
+@patch("summarizer.client.chat.completions.create", new_callable=AsyncMock)
+def test_duplicate_posts_are_not_prompted(mock_openai_create, test_db):
+    mock_openai_create.return_value.choices[0].message.content = "This is a summary."
+    text = "Everyone is talking about the same announcement from this morning, and here are the details."
+    posts = [{"title": "Announcement", "text": text, "url": f"http://test.com/{i}"} for i in range(5)]
+    requests_before = summarizer.dedup_stats["requests"]
+    asyncio.run(summarize_text(posts, "dedup"))
+    for call in mock_openai_create.call_args_list:
+        assert call.kwargs["messages"][1]["content"].count(text) == 1
+    assert summarizer.dedup_stats["requests"] - requests_before == 1
+
+@patch("summarizer.client.chat.completions.create", new_callable=AsyncMock)
+def test_summarize_document_is_not_trimmed(mock_openai_create, test_db):
+    mock_openai_create.return_value.choices[0].message.content = "This is a summary."
+    text = " ".join(f"Sentence {i} of a long page about things." for i in range(300))
+    assert dedup.DEDUP_POST_MAX_TOKENS < count_tokens(text) <= summarizer.SUMMARY_MAX_INPUT_TOKENS
+
+    asyncio.run(summarize_document(text, "Long Page", title="page"))
+    assert all(text in call.kwargs["messages"][1]["content"] for call in mock_openai_create.call_args_list)
+
+def test_split_into_chunks_respects_budget_and_boundaries():
+    paragraphs = [" ".join(f"Sentence {p}.{i} has a few words in it." for i in range(8)) for p in range(30)]
+    text = "\n\n".join(paragraphs)
+
+    chunks = split_into_chunks(text, max_tokens=200)
+
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 200 for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    assert " ".join(" ".join(chunks).split()) == " ".join(text.split())
+
+def test_summarize_document_reuses_unchanged_chunks(test_db):
+    async def echo_completion(**kwargs):
+        response = MagicMock()
+        response.choices[0].message.content = f"summary of {len(kwargs['messages'][1]['content'])} chars"
+        return response
+
+    paragraphs = [" ".join(f"Paragraph {p} sentence {i} talks about things." for i in range(10)) for p in range(40)]
+    edited = paragraphs[:-1] + [paragraphs[-1] + " One more sentence at the end."]
+
+    with patch("summarizer.SUMMARY_MAX_INPUT_TOKENS", 1000), patch("summarizer.SUMMARY_CHUNK_TOKENS", 300), \
+            patch("summarizer.client.chat.completions.create", side_effect=echo_completion) as mock_openai_create:
+        asyncio.run(summarize_document("\n\n".join(paragraphs), "Long Page", title="page"))
+        first_calls = mock_openai_create.call_count
+        mock_openai_create.reset_mock()
+        asyncio.run(summarize_document("\n\n".join(edited), "Long Page", title="page"))
+
+    chunk_count = len(split_into_chunks("\n\n".join(paragraphs), 300))
+    assert first_calls == chunk_count + 2 # every chunk, then the main and ui summaries
+    assert mock_openai_create.call_count == 1 + 2 # only the edited chunk is summarized again
+
+def test_summarize_document_stops_when_chunk_summaries_do_not_shrink(test_db):
+    async def verbose_completion(**kwargs):
+        response = MagicMock()
+        response.choices[0].message.content = kwargs["messages"][1]["content"]
+        return response
+
+    text = "\n\n".join(" ".join(f"Paragraph {p} sentence {i} talks about things." for i in range(10)) for p in range(40))
+    with patch("summarizer.SUMMARY_MAX_INPUT_TOKENS", 1000), patch("summarizer.SUMMARY_CHUNK_TOKENS", 300), \
+            patch("summarizer.client.chat.completions.create", side_effect=verbose_completion) as mock_openai_create:
+        asyncio.run(summarize_document(text, "Verbose Page", title="page"))
+
+    # One round of chunk summaries that came back longer, then the main and ui summaries of the cut result.
+    assert mock_openai_create.call_count == len(split_into_chunks(text, 300)) + 2
+
+def test_prioritize_topics_by_request_frequency():
+    topics = prioritize_topics(["r/news", "r/gaming", "r/pics"], {"r/pics": 5, "python": 3, "r/news": 1})
+    assert topics == ["r/pics", "python", "r/news", "r/gaming"]
+
+def test_precompute_resumes_unfinished_topics(test_db):
+    summarized = []
+
+    async def fake_summarize(posts, topic, **kwargs):
+        if topic == "r/broken" and not summarized.count(topic):
+            summarized.append(topic)
+            raise Exception("OpenAI API is down")
+        summarized.append(topic)
+        return "summary", "ui summary"
+
+    run_id = create_precompute_run(["r/news", "r/broken", "r/gaming"], time.time())
+    with patch("precompute.get_reddit_posts", return_value=[{"title": "t", "text": "x", "url": ""}]), \
+            patch("precompute.summarize_text", side_effect=fake_summarize):
+        update_precompute_progress(run_id, "r/news", "done")
+        # A crashed run is picked up again: only the topics not yet done are processed.
+        result = asyncio.run(run_precompute(concurrency=2))
+        assert result == {"run_id": run_id, "done": 2, "failed": 1}
+        assert sorted(summarized) == ["r/broken", "r/gaming"]
+
+        with patch("precompute.get_trending_topics", return_value=["r/broken"]):
+            result = asyncio.run(run_precompute(concurrency=2))
+        assert result["run_id"] != run_id
+        assert result["done"] == 1
+
+def test_precompute_stage_timeout(test_db):
+    async def slow_summarize(posts, topic, **kwargs):
+        await asyncio.sleep(1)
+
+    run_id = create_precompute_run(["r/slow"], time.time())
+    with patch("precompute.get_reddit_posts", return_value=[{"title": "t", "text": "x", "url": ""}]), \
+            patch("precompute.summarize_text", side_effect=slow_summarize):
+        result = asyncio.run(run_precompute(summarize_timeout=0.05))
+    assert result == {"run_id": run_id, "failed": 1}
+
+def test_precompute_regenerates_stale_topics(test_db):
+    async def slow_completion(**kwargs):
+        await asyncio.sleep(0.2)
+        response = MagicMock()
+        response.choices[0].message.content = "new summary"
+        return response
+
+    topic_key = "r/python-text-False-medium-basic"
+    save_summary_to_db(topic_key, "old summary", "old ui", time.time() - CACHE_TTL - 10)
+    cache.clear()
+
+    run_id = create_precompute_run(["r/python"], time.time())
+    # Requests would get the stale summary or an extractive one at once, leaving the refresh to a task that the run's loop cancels.
+    with patch("precompute.get_reddit_posts", return_value=[{"title": "t", "text": "A post about Python packaging.", "url": ""}]), \
+            patch("summarizer.client.chat.completions.create", side_effect=slow_completion), \
+            patch("summarizer.SUMMARY_STALE_GRACE", 3600), patch("summarizer.SUMMARY_LLM_LATENCY_BUDGET", 0.05):
+        assert asyncio.run(run_precompute()) == {"run_id": run_id, "done": 1}
+    cache.clear()
+    assert get_summary_from_db(topic_key)[0] == "new summary"
+
 def test_caching(test_db):
     topic = "test_topic"
     summary = "test_summary"
@@ -202,6 +964,84 @@ def test_caching(test_db):
     assert ui_summary == cached_ui_summary
     assert timestamp == cached_timestamp
 
+def test_connection_pool_exhausted(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), 1)
+    with pool.connection(), patch("database.DB_BUSY_TIMEOUT", 0.01):
+        with pytest.raises(sqlite3.OperationalError, match="connection pool exhausted"):
+            pool.acquire()
+    pool.close()
+
+def test_memory_cache_lru_eviction():
+    lru = LRUCache(max_entries=2)
+    lru.set("a", ("summary a", "ui a", 0.0))
+    lru.set("b", ("summary b", "ui b", 0.0))
+    assert lru.get("a") is not None # "a" is now the most recently used
+    lru.set("c", ("summary c", "ui c", 0.0))
+
+    assert lru.get("b") is None
+    assert lru.get("a") is not None
+    assert lru.get("c") is not None
+    assert lru.stats()["evictions"] == 1
+
+def test_memory_cache_byte_limit():
+    lru = LRUCache(max_bytes=15)
+    lru.set("a", ("x" * 10, ""))
+    lru.set("b", ("y" * 10, ""))
+    assert lru.get("a") is None
+    assert lru.get("b") is not None
+    assert lru.stats()["bytes"] == 10
+
+def test_memory_cache_expiry():
+    lru = LRUCache()
+    lru.set("fresh", "value", expires_at=time.time() + 60)
+    lru.set("expired", "value", expires_at=time.time() - 1)
+    assert lru.get("fresh") == "value"
+    assert lru.get("expired") is None
+    assert lru.stats()["hits"] == 1
+    assert lru.stats()["misses"] == 1
+
+def test_summary_cache_write_through(test_db):
+    timestamp = time.time()
+    save_summary_to_db("write_through", "summary", "ui_summary", timestamp)
+    assert cache.get("write_through") == ("summary", "ui_summary", timestamp)
+
+def test_db_uses_wal(test_db):
+    with db_connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+def test_db_concurrent_writes(test_db):
+    def write(i):
+        save_summary_to_db(f"topic-{i}", "summary", "ui_summary", time.time())
+        return get_summary_from_db(f"topic-{i}")
+
+    cache.clear()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(write, range(200)))
+    assert all(result is not None for result in results)
+
+def test_sqlite_rate_limit_storage_is_shared(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'limits.db'}"
+    # Two storages on one file stand in for two worker processes.
+    workers = [FixedWindowRateLimiter(storage_from_string(uri)) for _ in range(2)]
+    limit = parse("5/minute")
+    results = [workers[i % 2].hit(limit, "127.0.0.1") for i in range(6)]
+    assert results == [True] * 5 + [False]
+    assert workers[1].get_window_stats(limit, "127.0.0.1").remaining == 0
+
+def test_leader_lease_single_holder(test_db):
+    first, second = LeaderLease("test-job", ttl=0.2), LeaderLease("test-job", ttl=0.2)
+    assert first.renew() and not second.renew()
+    ran = []
+    second.run_if_leader(lambda: ran.append("second"))()
+    assert ran == []
+
+    # An expired lease can be taken over; a released one at once.
+    time.sleep(0.25)
+    assert second.renew() and not first.renew()
+    second.release()
+    first.run_if_leader(lambda: ran.append("first"))()
+    assert ran == ["first"]
+
 def test_get_admin_summaries_no_auth():
     response = client.get("/admin")
     assert response.status_code == 401
@@ -210,6 +1050,115 @@ def test_get_admin_summaries_with_auth(test_db):
     response = client.get("/admin", auth=("admin", "admin123"))
     assert response.status_code == 200
 
+def test_admin_summaries_keyset_pagination(test_db):
+    now = time.time()
+    for i in range(5):
+        save_summary_to_db(f"topic-{i}", "summary " * 100, f"ui {i}", now - i * 60)
+    save_summary_to_db("other-topic", "summary", "ui", now - 3600)
+    # Hash-keyed copies are not topics and stay out of the listing.
+    save_summary_to_db("content-abc", "summary", "ui", now)
+    save_summary_to_db("document-abc", "summary", "ui", now)
+
+    topics, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/admin", params=params, auth=("admin", "admin123")).json()
+        assert len(page["items"]) <= 2
+        topics.extend(item["topic"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert topics == [f"topic-{i}" for i in range(5)] + ["other-topic"]
+    item = client.get("/admin", params={"limit": 1}, auth=("admin", "admin123")).json()["items"][0]
+    assert set(item) == {"topic", "ui_summary", "summary_preview", "timestamp"}
+    assert len(item["summary_preview"]) == 200
+
+def test_admin_summaries_filters(test_db):
+    now = time.time()
+    save_summary_to_db("python-text", "summary", "ui", now)
+    save_summary_to_db("python-bullets", "summary", "ui", now - 7200)
+    save_summary_to_db("rust-text", "summary", "ui", now)
+
+    page = client.get("/admin", params={"prefix": "python"}, auth=("admin", "admin123")).json()
+    assert [item["topic"] for item in page["items"]] == ["python-text", "python-bullets"]
+
+    page = client.get("/admin", params={"prefix": "python", "max_age": 3600}, auth=("admin", "admin123")).json()
+    assert [item["topic"] for item in page["items"]] == ["python-text"]
+
+    response = client.get("/admin", params={"cursor": "not-a-cursor"}, auth=("admin", "admin123"))
+    assert response.status_code == 400
+
+def test_admin_search_summaries(test_db):
+    now = time.time()
+    save_summary_to_db("python", "Python packaging keeps improving.", "ui", now)
+    save_summary_to_db("rust", "Rust compile times are the main complaint.", "ui", now)
+    save_summary_to_db("content-abc", "Python packaging keeps improving.", "ui", now)
+
+    page = client.get("/admin/search", params={"q": "packaging"}, auth=("admin", "admin123")).json()
+    assert [result["topic"] for result in page["results"]] == ["python"]
+    assert "[packaging]" in page["results"][0]["snippet"]
+    assert page["next_offset"] is None
+
+    # Updates and deletes keep the index in sync with the table.
+    save_summary_to_db("python", "Python typing discussion.", "ui", now)
+    assert client.get("/admin/search", params={"q": "packaging"}, auth=("admin", "admin123")).json()["results"] == []
+    delete_summary_from_db("rust")
+    assert client.get("/admin/search", params={"q": "rust"}, auth=("admin", "admin123")).json()["results"] == []
+
+    # Query syntax in user input is treated as plain text.
+    response = client.get("/admin/search", params={"q": 'typing" OR NEAR('}, auth=("admin", "admin123"))
+    assert response.status_code == 200
+
+def test_init_db_adds_integer_id_to_legacy_summaries(test_db):
+    with db_connection() as conn, conn:
+        conn.executescript("""
+            DROP TRIGGER summaries_fts_insert; DROP TRIGGER summaries_fts_delete; DROP TRIGGER summaries_fts_update;
+            DROP TABLE summaries_fts; DROP TABLE summaries;
+            CREATE TABLE summaries (topic TEXT PRIMARY KEY, summary TEXT, ui_summary TEXT, timestamp REAL);
+            INSERT INTO summaries VALUES ('python', 'Python packaging keeps improving.', 'ui', 1.0);
+        """)
+    init_db()
+
+    with db_connection() as conn:
+        assert "id" in {row[1] for row in conn.execute("PRAGMA table_info(summaries)")}
+        conn.execute("VACUUM")
+    results = client.get("/admin/search", params={"q": "packaging"}, auth=("admin", "admin123")).json()["results"]
+    assert [result["topic"] for result in results] == ["python"]
+
+def test_admin_search_posts_ranking_and_pagination(test_db):
+    save_posts("reddit", [
+        {"id": "a", "title": "Async Python tips", "text": "Use asyncio for IO bound work.", "url": ""},
+        {"id": "b", "title": "Gardening", "text": "Tomatoes love Python-free sunshine and asyncio-free soil.", "url": ""},
+        {"id": "c", "title": "Cooking", "text": "Nothing relevant here at all.", "url": ""},
+    ], time.time())
+    save_posts("reddit", [{"id": "a", "title": "Async Python tips", "text": "Use asyncio for IO bound work.", "url": ""}], time.time())
+
+    page = client.get("/admin/search", params={"q": "python asyncio", "scope": "posts", "limit": 1}, auth=("admin", "admin123")).json()
+    assert [result["title"] for result in page["results"]] == ["Async Python tips"]
+    assert page["next_offset"] == 1
+    page = client.get("/admin/search", params={"q": "python asyncio", "scope": "posts", "limit": 1, "offset": 1}, auth=("admin", "admin123")).json()
+    assert [result["title"] for result in page["results"]] == ["Gardening"]
+    assert page["next_offset"] is None
+
+    response = client.get("/admin/search", params={"q": "python", "scope": "users"}, auth=("admin", "admin123"))
+    assert response.status_code == 400
+
+def test_init_db_replaces_outdated_fts_triggers(test_db):
+    with db_connection() as conn, conn:
+        conn.executescript("""
+            DROP TRIGGER posts_fts_update;
+            CREATE TRIGGER posts_fts_update AFTER UPDATE ON posts BEGIN
+                INSERT INTO posts_fts (posts_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+                INSERT INTO posts_fts (rowid, title, text) VALUES (new.id, new.title, new.text);
+            END;
+        """)
+    init_db()
+
+    with db_connection() as conn:
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE name='posts_fts_update'").fetchone()[0]
+    assert "AFTER UPDATE OF title, text ON posts" in sql
+
 def test_delete_summary(test_db):
     topic = "test_topic"
     summary = "test_summary"
@@ -223,3 +1172,31 @@ def test_delete_summary(test_db):
 
     cached_summary = get_summary_from_db(topic)
     assert cached_summary is None
+
+@patch("summarizer.client.chat.completions.create", new_callable=AsyncMock)
+def test_delete_summary_drops_content_keyed_copy(mock_openai_create, test_db):
+    mock_openai_create.return_value.choices[0].message.content = "This is a summary."
+    posts = [{"title": "Post 1", "text": "This is the first post and it is long enough.", "url": "http://test.com/1"}]
+    later_posts = [{"title": "Post 2", "text": "This is a later post and it is long enough.", "url": "http://test.com/2"}]
+    asyncio.run(summarize_text(posts, "python"))
+    asyncio.run(summarize_text(later_posts, "python"))
+    assert mock_openai_create.call_count == 4
+
+    # Every content-keyed copy the topic has had goes with it, not just the latest.
+    response = client.delete("/admin/delete/python-text-False-medium-basic", auth=("admin", "admin123"))
+    assert response.status_code == 200
+    asyncio.run(summarize_text(posts, "python"))
+    assert mock_openai_create.call_count == 6
+
+def test_prune_derived_summaries(test_db):
+    now = time.time()
+    old = now - summarizer.SUMMARY_CONTENT_TTL - 1
+    save_summary_to_db("content-old", "summary", "ui", old)
+    save_summary_to_db("document-old", "summary", "ui", old)
+    save_summary_to_db("content-new", "summary", "ui", now)
+    save_summary_to_db("python-text-False-medium-basic", "summary", "ui", old)
+
+    assert prune_derived_summaries(now) == 2
+    with db_connection() as conn:
+        topics = {row[0] for row in conn.execute("SELECT topic FROM summaries")}
+    assert topics == {"content-new", "python-text-False-medium-basic"}
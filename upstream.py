@@ -0,0 +1,328 @@
+"""Shared policy for calls to upstream APIs (Reddit, Hacker News).
+
+Every call goes through `request` (requests sessions) or `arequest` (httpx
+async clients), which add:
+  - deadlines: the time left of the request being served bounds every attempt
+    (see `deadline` and DeadlineMiddleware), and no retry is started past it;
+  - retries with jittered exponential backoff on connection errors, timeouts,
+    429 and 5xx, for idempotent calls only. Retry-After is honoured;
+  - a per-host token bucket that paces calls from the X-Ratelimit-Remaining /
+    X-Ratelimit-Reset headers, so a quota lasts until its window resets;
+  - a per-host circuit breaker that fails fast with a 503 once a host keeps
+    failing, letting one trial call through after a cooldown.
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import httpx
+import requests
+from fastapi import HTTPException
+from metrics import record_upstream
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-attempt timeout, further bounded by the deadline of the request being served.
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10"))
+# Deadline for all upstream calls made while serving one HTTP request.
+UPSTREAM_DEADLINE = float(os.getenv("UPSTREAM_DEADLINE", "30"))
+# Retries after the first attempt of an idempotent call.
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.2"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "5"))
+# Calls a host may burst before rate-limit pacing applies.
+UPSTREAM_BURST = int(os.getenv("UPSTREAM_BURST", "10"))
+# Consecutive failures (errors, timeouts, 5xx) that open a host's breaker, and
+# how long it stays open before a trial call is let through.
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+
+class DeadlineExceeded(HTTPException):
+    def __init__(self, detail: str = "Upstream deadline exceeded."):
+        super().__init__(status_code=504, detail=detail)
+
+class UpstreamUnavailable(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(status_code=503, detail=detail)
+
+@contextmanager
+def deadline(seconds: float | None = None):
+    """Bounds upstream calls made in the block (and tasks or threads started from it) to `seconds`, UPSTREAM_DEADLINE by default.
+
+    Nested deadlines can only shorten the one already in effect.
+    """
+    seconds = UPSTREAM_DEADLINE if seconds is None else seconds
+    current = _deadline.get()
+    expires_at = time.monotonic() + seconds
+    token = _deadline.set(expires_at if current is None else min(current, expires_at))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def time_left():
+    """Seconds left until the current deadline, or None without one."""
+    expires_at = _deadline.get()
+    return None if expires_at is None else expires_at - time.monotonic()
+
+class TokenBucket:
+    """Paces calls to spend the remaining quota evenly until the quota window resets.
+
+    Unlimited until a response reports rate-limit headers. Reservations may take
+    the bucket below zero, so concurrent callers queue behind each other.
+    """
+
+    def __init__(self, burst: int = UPSTREAM_BURST):
+        self.burst = burst
+        self.rate = None
+        self.tokens = 0.0
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def update(self, remaining: float, reset: float):
+        """Applies the quota reported by a response: `remaining` calls over the next `reset` seconds."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if remaining < 1:
+                self.blocked_until = now + reset
+                self.tokens = min(self.tokens, 0.0)
+                return
+            first = self.rate is None
+            self.rate = remaining / max(reset, 1.0)
+            self.tokens = min(self.burst, remaining) if first else min(self.tokens, remaining)
+
+    def reserve(self) -> float:
+        """Takes a token, returning how many seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, self.blocked_until - now)
+            if self.rate is None:
+                return wait
+            self.tokens -= 1
+            return max(wait, -self.tokens / self.rate if self.tokens < 0 else 0.0)
+
+    def refund(self):
+        with self._lock:
+            if self.rate is not None:
+                self.tokens += 1
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive failures; after `cooldown` one trial call decides whether it closes."""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.failure_threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        # When the current trial call was let through; a trial that never reports
+        # back (e.g. its caller was cancelled) is replaced after another cooldown.
+        self._trial_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at >= self.cooldown and (self._trial_at is None or now - self._trial_at >= self.cooldown):
+                self._trial_at = now
+                return True
+            return False
+
+    def record(self, success: bool):
+        with self._lock:
+            was_trial, self._trial_at = self._trial_at is not None, None
+            if success:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if was_trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+class _Host:
+    def __init__(self):
+        self.bucket = TokenBucket()
+        self.breaker = CircuitBreaker()
+
+_hosts: dict[str, _Host] = {}
+_hosts_lock = threading.Lock()
+
+def _host(name: str) -> _Host:
+    with _hosts_lock:
+        if name not in _hosts:
+            _hosts[name] = _Host()
+        return _hosts[name]
+
+def upstream_stats() -> dict:
+    """Breaker state and rate-limit pacing per upstream host."""
+    return {
+        name: {"breaker": host.breaker.state, "failures": host.breaker.failures,
+               "rate_per_s": host.bucket.rate, "tokens": round(host.bucket.tokens, 2)}
+        for name, host in list(_hosts.items())
+    }
+
+def reset_upstreams():
+    """Forgets all breaker and rate-limit state."""
+    with _hosts_lock:
+        _hosts.clear()
+
+def _header_float(headers, name: str):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+class _Call:
+    """Retry, pacing and breaker bookkeeping for one logical call; the I/O is left to the caller."""
+
+    def __init__(self, upstream: str, method: str, host: str, idempotent: bool | None, retries: int | None, count_timeouts: bool = True):
+        self.upstream = upstream
+        self.count_timeouts = count_timeouts
+        self.host = _host(host)
+        idempotent = method.upper() in IDEMPOTENT_METHODS if idempotent is None else idempotent
+        self.retries = (UPSTREAM_RETRIES if retries is None else retries) if idempotent else 0
+        self.attempt = 0
+
+    def before_attempt(self) -> float:
+        """Returns the wait before the next attempt, raising if the call cannot be made in time."""
+        left = time_left()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded()
+        wait = self.host.bucket.reserve()
+        if left is not None and wait >= left:
+            self.host.bucket.refund()
+            raise UpstreamUnavailable(f"{self.upstream} rate limit leaves no time before the deadline.")
+        if not self.host.breaker.allow():
+            self.host.bucket.refund()
+            raise UpstreamUnavailable(f"{self.upstream} is unavailable; retrying after its circuit breaker cools down.")
+        self.attempt += 1
+        return wait
+
+    def timeout(self, timeout: float) -> float:
+        left = time_left()
+        return timeout if left is None else max(0.001, min(timeout, left))
+
+    def _retry_delay(self, retry_after: float | None = None):
+        if self.attempt > self.retries:
+            return None
+        delay = random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * 2 ** (self.attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        left = time_left()
+        if left is not None and delay >= left:
+            return None
+        return delay
+
+    def responded(self, status: int, headers):
+        """Records a response; returns the delay before retrying it, or None to return it."""
+        record_upstream(self.upstream, status)
+        remaining, reset = _header_float(headers, "X-Ratelimit-Remaining"), _header_float(headers, "X-Ratelimit-Reset")
+        if remaining is not None and reset is not None:
+            self.host.bucket.update(remaining, reset)
+        self.host.breaker.record(status < 500)
+        if status not in RETRY_STATUSES:
+            return None
+        delay = self._retry_delay(_header_float(headers, "Retry-After"))
+        if delay is not None:
+            logger.warning(f"Retrying {self.upstream} call after HTTP {status} in {delay:.2f}s")
+        return delay
+
+    def failed(self, error: Exception, timed_out: bool):
+        """Records a failed attempt; returns the delay before retrying it, or None to raise."""
+        record_upstream(self.upstream, "timeout" if timed_out else "error")
+        if self.count_timeouts or not timed_out:
+            self.host.breaker.record(False)
+        delay = self._retry_delay()
+        if delay is not None:
+            logger.warning(f"Retrying {self.upstream} call after {error!r} in {delay:.2f}s")
+        return delay
+
+def request(session: requests.Session, upstream: str, method: str, url: str, idempotent: bool | None = None,
+            retries: int | None = None, timeout: float = UPSTREAM_TIMEOUT, count_timeouts: bool = True, **kwargs) -> requests.Response:
+    """Sends a request through a requests session under the upstream policy.
+
+    Returns the last response, whatever its status; raises the last error if every attempt failed.
+    With count_timeouts=False, timed out attempts do not count toward the host's
+    circuit breaker, for calls whose timeout is tighter than the host's health requires.
+    """
+    call = _Call(upstream, method, urlsplit(url).netloc, idempotent, retries, count_timeouts)
+    while True:
+        time.sleep(call.before_attempt())
+        try:
+            res = session.request(method, url, timeout=call.timeout(timeout), **kwargs)
+        except requests.RequestException as e:
+            delay = call.failed(e, isinstance(e, requests.Timeout))
+            if delay is None:
+                raise
+        else:
+            delay = call.responded(res.status_code, res.headers)
+            if delay is None:
+                return res
+        time.sleep(delay)
+
+async def arequest(client: httpx.AsyncClient, upstream: str, method: str, url: str, idempotent: bool | None = None,
+                   retries: int | None = None, timeout: float = UPSTREAM_TIMEOUT, count_timeouts: bool = True, **kwargs) -> httpx.Response:
+    """Sends a request through an httpx async client under the upstream policy.
+
+    Each attempt is bounded as a whole, not just per socket operation. Returns
+    the last response, whatever its status; raises the last error if every attempt
+    failed. count_timeouts is as for `request`.
+    """
+    call = _Call(upstream, method, urlsplit(str(client.base_url.join(url))).netloc, idempotent, retries, count_timeouts)
+    while True:
+        await asyncio.sleep(call.before_attempt())
+        try:
+            res = await asyncio.wait_for(client.request(method, url, **kwargs), call.timeout(timeout))
+        except (asyncio.TimeoutError, httpx.HTTPError) as e:
+            delay = call.failed(e, isinstance(e, (asyncio.TimeoutError, httpx.TimeoutException)))
+            if delay is None:
+                raise
+        else:
+            delay = call.responded(res.status_code, res.headers)
+            if delay is None:
+                return res
+        await asyncio.sleep(delay)
+
+class DeadlineMiddleware:
+    """ASGI middleware giving every HTTP request an UPSTREAM_DEADLINE for its upstream calls.
+
+    Routes in `exclude_paths` set their own deadlines, e.g. one per item of a
+    streamed batch, which would otherwise share a single budget.
+    """
+
+    def __init__(self, app, seconds: float | None = None, exclude_paths=()):
+        self.app = app
+        self.seconds = seconds
+        self.exclude_paths = frozenset(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+        with deadline(self.seconds):
+            await self.app(scope, receive, send)
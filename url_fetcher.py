@@ -0,0 +1,161 @@
+"""Fetches web pages for summarization and extracts their main text.
+
+Downloads are streamed under a byte cap and an overall deadline, and only
+HTML (or plain text) responses are parsed. Extracted text is cached per URL
+together with the response's ETag/Last-Modified validators, so fetching a
+page again costs a conditional GET that usually ends in a 304.
+"""
+import os
+import re
+import time
+import asyncio
+import functools
+import httpx
+from fastapi import HTTPException
+from database import run_db, get_cached_url, save_cached_url, touch_cached_url
+from metrics import span, record_upstream
+import logging
+
+logger = logging.getLogger(__name__)
+
+URL_FETCH_TIMEOUT = float(os.getenv("URL_FETCH_TIMEOUT", "10"))
+URL_MAX_BYTES = int(os.getenv("URL_MAX_BYTES", str(2 * 1024 * 1024)))
+URL_USER_AGENT = os.getenv("URL_USER_AGENT", "centrify-summarizer/1.0")
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+TEXT_CONTENT_TYPES = ("text/plain",)
+
+# Elements whose text is never part of the article body.
+BOILERPLATE_TAGS = ("script", "style", "noscript", "template", "svg", "iframe", "nav", "header", "footer", "aside", "form", "button")
+# Elements that start a new line in the extracted text.
+BLOCK_TAGS = ("p", "div", "section", "article", "main", "li", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "tr", "br", "dd", "dt")
+
+url_cache_stats = {"fetched": 0, "revalidated": 0, "truncated": 0}
+
+_BLANK_RE = re.compile(r"[ \t\r\f\v]+")
+
+def _clean_lines(text: str) -> str:
+    lines = (_BLANK_RE.sub(" ", line).strip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+@functools.lru_cache(maxsize=1)
+def html_parser():
+    """lxml.html if lxml is installed, else None. Parsers are imported on first use to keep them out of startup."""
+    try:
+        import lxml.html
+    except ImportError:
+        return None
+    return lxml.html
+
+def _extract_with_lxml(lxml_html, body: bytes, encoding: str | None) -> tuple:
+    parser = lxml_html.HTMLParser(encoding=encoding, remove_comments=True)
+    try:
+        doc = lxml_html.document_fromstring(body, parser=parser)
+    except lxml_html.etree.ParserError:
+        # Nothing but comments or whitespace once parsed.
+        return "", ""
+    title = (doc.findtext(".//title") or "").strip()
+    for element in doc.xpath("|".join(f"//{tag}" for tag in BOILERPLATE_TAGS)):
+        element.drop_tree()
+    candidates = doc.xpath("//article|//main|//*[@role='main']")
+    root = max(candidates, key=lambda element: len(element.text_content())) if candidates else doc.body
+    if root is None:
+        return title, ""
+    for element in root.iter(*BLOCK_TAGS):
+        element.tail = "\n" + (element.tail or "")
+    return title, _clean_lines(root.text_content())
+
+def _extract_with_bs4(body: bytes, encoding: str | None) -> tuple:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(body, "html.parser", from_encoding=encoding)
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    for element in soup(BOILERPLATE_TAGS):
+        element.decompose()
+    candidates = soup.find_all(["article", "main"]) + soup.find_all(attrs={"role": "main"})
+    root = max(candidates, key=lambda element: len(element.get_text())) if candidates else (soup.body or soup)
+    return title, _clean_lines(root.get_text("\n"))
+
+def extract_text(body: bytes, content_type: str = "text/html", encoding: str | None = None) -> tuple:
+    """Returns (title, main text) of a page, without scripts, styles and navigation.
+
+    Uses lxml when it is installed, otherwise BeautifulSoup's pure-Python parser.
+    """
+    if not body.strip():
+        return "", ""
+    if content_type in TEXT_CONTENT_TYPES:
+        return "", _clean_lines(body.decode(encoding or "utf-8", errors="replace"))
+    lxml_html = html_parser()
+    if lxml_html is not None:
+        return _extract_with_lxml(lxml_html, body, encoding)
+    return _extract_with_bs4(body, encoding)
+
+class UrlFetcher:
+    """Async page fetcher with size and time limits and a revalidating cache."""
+
+    def __init__(self, max_bytes: int = URL_MAX_BYTES, timeout: float = URL_FETCH_TIMEOUT, transport=None):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.transport = transport
+        self._client = None
+        self._client_loop = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Pooled connections belong to the event loop that opened them.
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=True, transport=self.transport,
+                                             headers={"User-Agent": URL_USER_AGENT})
+            self._client_loop = loop
+        return self._client
+
+    async def _download(self, url: str, headers: dict):
+        """Returns (response, body) with the body cut at max_bytes, or (response, None) for a 304."""
+        async with self.client.stream("GET", url, headers=headers) as res:
+            record_upstream("url", res.status_code)
+            if res.status_code == 304:
+                return res, None
+            res.raise_for_status()
+            content_type = res.headers.get("content-type", "").split(";")[0].strip().lower()
+            if content_type not in HTML_CONTENT_TYPES + TEXT_CONTENT_TYPES:
+                raise HTTPException(status_code=415, detail=f"Unsupported content type: {content_type or 'unknown'}.")
+            body = bytearray()
+            async for chunk in res.aiter_bytes():
+                body += chunk
+                if len(body) >= self.max_bytes:
+                    logger.warning(f"Truncating {url} at {self.max_bytes} bytes")
+                    url_cache_stats["truncated"] += 1
+                    break
+            return res, bytes(body[:self.max_bytes])
+
+    async def fetch(self, url: str) -> dict:
+        """Returns {"title", "text", "url"} for a page, revalidating a cached copy when there is one."""
+        cached = await run_db(get_cached_url, url)
+        headers = {}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+        try:
+            with span("url.download"):
+                res, body = await asyncio.wait_for(self._download(url, headers), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Timed out fetching URL.")
+
+        if body is None:
+            if not cached:
+                raise HTTPException(status_code=502, detail="Unexpected 304 response for an uncached URL.")
+            url_cache_stats["revalidated"] += 1
+            await run_db(touch_cached_url, url, time.time())
+            return {"title": cached["title"], "text": cached["text"], "url": url}
+
+        url_cache_stats["fetched"] += 1
+        content_type = res.headers.get("content-type", "").split(";")[0].strip().lower()
+        with span("url.extract"):
+            title, text = await asyncio.to_thread(extract_text, body, content_type, res.charset_encoding)
+        etag, last_modified = res.headers.get("etag"), res.headers.get("last-modified")
+        if etag or last_modified:
+            await run_db(save_cached_url, url, etag, last_modified, title, text, time.time())
+        return {"title": title, "text": text, "url": url}
+
+url_fetcher = UrlFetcher()